@@ -0,0 +1,149 @@
+import hashlib
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from . import paths
+
+default_bands = {'low': (20, 250), 'mid': (250, 2000), 'high': (2000, 11025)}
+
+
+class AudioFeatures:
+    """
+    Per-frame audio features for music-reactive renders, computed once and cached on disk.
+    The audio is decoded once to a mono float32 .npy (memory-mapped on later runs),
+    then the features are computed vectorized at a given fps and cached by audio hash and fps.
+
+    Features, one value per frame, normalized to [0, 1]:
+        rms: loudness
+        onset: spectral flux, peaks on hits
+        low, mid, high: energy of the frequency bands
+
+    audio = session.audio  # or AudioFeatures(path)
+    audio.features(24)['rms'][f - 1]
+    """
+
+    def __init__(self, path, sr=22050, cachedir=None):
+        """
+        Args:
+            path: The audio or video file
+            sr: Sample rate to decode at
+            cachedir: Where to cache the decoded audio and features, defaults to paths.tmp/audio
+        """
+        self.path = Path(path)
+        self.sr = sr
+        self.cachedir = Path(cachedir or paths.tmp / 'audio')
+        self._hash = None
+        self._samples = None
+        self._features = {}  # fps -> dict
+
+    @property
+    def hash(self) -> str:
+        """
+        Returns: A hash of the audio file's content
+        """
+        if self._hash is None:
+            h = hashlib.blake2b(digest_size=16)
+            with open(self.path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            self._hash = h.hexdigest()
+        return self._hash
+
+    @property
+    def samples(self) -> np.ndarray:
+        """
+        Returns: The mono float32 samples, memory-mapped from the cache.
+        """
+        if self._samples is None:
+            cache = self.cachedir / f'{self.hash}_{self.sr}.npy'
+            if not cache.exists():
+                self.cachedir.mkdir(parents=True, exist_ok=True)
+                tmp = cache.with_suffix('.tmp.npy')
+                np.save(tmp.as_posix(), decode(self.path, self.sr))
+                tmp.replace(cache)
+            self._samples = np.load(cache.as_posix(), mmap_mode='r')
+        return self._samples
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sr
+
+    def features(self, fps, bands=None) -> dict[str, np.ndarray]:
+        """
+        Returns: feature name -> array of one value per frame (frame f is at index f-1)
+        """
+        bands = bands or default_bands
+        key = (fps, tuple(sorted(bands.items())))
+        if key in self._features:
+            return self._features[key]
+
+        bandkey = hashlib.blake2b(repr(key[1]).encode(), digest_size=4).hexdigest()
+        cache = self.cachedir / f'{self.hash}_{self.sr}_{fps:g}fps_{bandkey}.npz'
+        if cache.exists():
+            with np.load(cache.as_posix()) as z:
+                ret = {k: z[k] for k in z.files}
+        else:
+            ret = compute_features(self.samples, self.sr, fps, bands)
+            self.cachedir.mkdir(parents=True, exist_ok=True)
+            tmp = cache.with_suffix('.tmp.npz')
+            np.savez(tmp.as_posix(), **ret)
+            tmp.replace(cache)
+
+        self._features[key] = ret
+        return ret
+
+
+def decode(path, sr=22050) -> np.ndarray:
+    """
+    Decode any audio or video file to mono float32 samples with ffmpeg.
+    """
+    proc = subprocess.run(['ffmpeg', '-v', 'error', '-i', Path(path).as_posix(), '-f', 'f32le', '-ac', '1', '-ar', str(sr), '-'],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg couldn't decode {path}: {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+
+def compute_features(samples, sr, fps, bands=None, chunk=512) -> dict[str, np.ndarray]:
+    """
+    Compute the per-frame features, one analysis window centered on each frame.
+    Frames are processed in chunks to bound the memory of the windows.
+    """
+    bands = bands or default_bands
+    hop = sr / fps
+    n = int(np.ceil(len(samples) / hop))
+    win = 1 << int(np.ceil(np.log2(max(2 * hop, 256))))
+
+    padded = np.pad(np.asarray(samples, dtype=np.float32), (win // 2, win // 2 + int(hop) + 1))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, win)
+    starts = np.round(np.arange(n) * hop).astype(np.int64)
+    hann = np.hanning(win).astype(np.float32)
+    freqs = np.fft.rfftfreq(win, 1 / sr)
+    masks = {name: (freqs >= lo) & (freqs < hi) for name, (lo, hi) in bands.items()}
+
+    rms = np.empty(n, dtype=np.float32)
+    flux = np.empty(n, dtype=np.float32)
+    band_energy = {name: np.empty(n, dtype=np.float32) for name in bands}
+    prev = None
+    for i in range(0, n, chunk):
+        w = windows[starts[i:i + chunk]]
+        rms[i:i + chunk] = np.sqrt(np.mean(w * w, axis=1))
+
+        mag = np.abs(np.fft.rfft(w * hann, axis=1)).astype(np.float32)
+        for name, mask in masks.items():
+            band_energy[name][i:i + chunk] = mag[:, mask].mean(axis=1) if mask.any() else 0
+
+        # Spectral flux against the previous frame, across chunks too
+        prevmag = np.vstack([mag[:1] if prev is None else prev, mag[:-1]])
+        flux[i:i + chunk] = np.maximum(mag - prevmag, 0).sum(axis=1)
+        prev = mag[-1:]
+
+    ret = dict(rms=rms, onset=flux, **band_energy)
+    return {k: normalize(v) for k, v in ret.items()}
+
+
+def normalize(v: np.ndarray) -> np.ndarray:
+    hi = v.max() if len(v) else 0
+    return v / hi if hi > 0 else v
@@ -0,0 +1,114 @@
+import bisect
+import os
+
+from . import paths
+
+
+class FrameRange:
+    """
+    The numbered frames present in a sequence directory (00000001.jpg, 00000002.jpg, ...),
+    to map any frame number into the sequence in O(1) without listing the directory.
+
+    Modes:
+        loop: 1 2 3 1 2 3 ...
+        pingpong: 1 2 3 2 1 2 ...
+        clamp: 1 2 3 3 3 ...
+    """
+    __slots__ = ('first', 'last', 'count', 'frames', 'suffix')
+
+    def __init__(self, frames, suffix='.jpg'):
+        """
+        Args:
+            frames: The sorted frame numbers
+            suffix: The extension of the frame files
+        """
+        self.frames = frames
+        self.count = len(frames)
+        self.first = frames[0] if frames else 0
+        self.last = frames[-1] if frames else 0
+        self.suffix = suffix
+
+    @staticmethod
+    def from_names(names) -> "FrameRange":
+        """
+        Build from the file names of a directory, ignoring anything that isn't a numbered image.
+        """
+        frames = []
+        suffixes = {}
+        for name in names:
+            stem, suffix = os.path.splitext(name)
+            if suffix in paths.image_exts and stem.isdigit():
+                frames.append(int(stem))
+                suffixes[suffix] = suffixes.get(suffix, 0) + 1
+
+        frames.sort()
+        suffix = max(suffixes, key=suffixes.get) if suffixes else '.jpg'
+        return FrameRange(frames, suffix)
+
+    @property
+    def has_gaps(self):
+        return self.count > 0 and self.last - self.first + 1 != self.count
+
+    @property
+    def gaps(self) -> list[int]:
+        """
+        Returns: The missing frame numbers between first and last.
+        """
+        if not self.has_gaps:
+            return []
+        present = set(self.frames)
+        return [f for f in range(self.first, self.last + 1) if f not in present]
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, f):
+        if not self.has_gaps:
+            return self.first <= f <= self.last
+        i = bisect.bisect_left(self.frames, f)
+        return i < self.count and self.frames[i] == f
+
+    def index(self, i) -> int:
+        """
+        Returns: The frame number at position i in the sequence.
+        """
+        if not self.has_gaps:
+            return self.first + i
+        return self.frames[i]
+
+    def map(self, f, mode='loop') -> int:
+        """
+        Map a frame number into the sequence.
+        Args:
+            f: The frame number, usually the session's current frame
+            mode: 'loop', 'pingpong', 'clamp', or None to return f unchanged
+
+        Returns: The frame number to read
+        """
+        if not mode or self.count == 0:
+            return f
+        if mode is True:
+            mode = 'loop'
+
+        i = f - self.first
+        if mode == 'loop':
+            i %= self.count
+        elif mode == 'pingpong':
+            period = 2 * (self.count - 1)
+            if period == 0:
+                i = 0
+            else:
+                i %= period
+                if i >= self.count:
+                    i = period - i
+        elif mode == 'clamp':
+            if not self.has_gaps:
+                return min(max(f, self.first), self.last)
+            i = min(max(bisect.bisect_right(self.frames, f) - 1, 0), self.count - 1)
+        else:
+            raise ValueError(f"Unknown frame mode: {mode}")
+
+        return self.index(i)
+
+    def __repr__(self):
+        return f"FrameRange({self.first}:{self.last}, count={self.count}, gaps={self.has_gaps})"
@@ -0,0 +1,114 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    A ring of fixed-size frame slots in shared memory, to pass frames between
+    processes without pickling them. Frames travel as slot handles (ints),
+    and both sides access the pixels through numpy views over the shared buffer.
+
+    ring = FrameRing((h, w, 3), slots=8)
+    slot = ring.write(img)  # producer, one copy into the slot
+    img = ring.view(slot)   # consumer, zero-copy
+    ring.release(slot)      # hand the slot back once done with the view
+
+    The ring re-attaches to the same memory when it is sent to a child process at creation,
+    e.g. through a pool initializer. (the free-slot queue cannot be sent through a task)
+    """
+
+    def __init__(self, shape, slots=8, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.slot_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.owner = True
+
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_size * slots)
+        self.free = mp.Queue()
+        for i in range(slots):
+            self.free.put(i)
+
+        self._buffer = self._make_buffer()
+
+    @staticmethod
+    def for_session(session, slots=8) -> "FrameRing":
+        """
+        Returns: A ring with slots sized to the session's w×h×3
+        """
+        return FrameRing((session.h, session.w, 3), slots)
+
+    def _make_buffer(self):
+        return np.ndarray((self.slots, *self.shape), dtype=self.dtype, buffer=self.shm.buf)
+
+    def __getstate__(self):
+        return dict(name=self.shm.name,
+                    shape=self.shape,
+                    dtype=self.dtype.str,
+                    slots=self.slots,
+                    free=self.free)
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.dtype = np.dtype(state['dtype'])
+        self.slots = state['slots']
+        self.slot_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.owner = False
+
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self.free = state['free']
+        self._buffer = self._make_buffer()
+
+    def fits(self, arr) -> bool:
+        """
+        Returns: Whether the array can be stored in a slot
+        """
+        return isinstance(arr, np.ndarray) and arr.shape == self.shape and arr.dtype == self.dtype
+
+    def acquire(self, timeout=None) -> int:
+        """
+        Take a free slot, blocking until one is available.
+        """
+        return self.free.get(timeout=timeout)
+
+    def release(self, slot: int):
+        """
+        Hand a slot back to the ring, views of it must not be used afterwards.
+        """
+        self.free.put(slot)
+
+    def view(self, slot: int) -> np.ndarray:
+        """
+        Returns: A zero-copy view of the slot
+        """
+        return self._buffer[slot]
+
+    def write(self, arr: np.ndarray, timeout=None) -> int:
+        """
+        Copy a frame into a free slot.
+        Returns: The slot handle
+        """
+        slot = self.acquire(timeout)
+        self._buffer[slot] = arr
+        return slot
+
+    def close(self):
+        """
+        Detach from the shared memory, the owner also frees it.
+        """
+        if self.shm is None:
+            return
+
+        self._buffer = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,210 @@
+import re
+
+
+class FrameSet:
+    """
+    A compiled selection of frames, for every consumer of a frame range (make_video, copy_frames, map_frames, ...)
+
+    Spec: comma-separated items, applied in order
+        '1:100'             frames 1 to 100 inclusive
+        '1:100,200:300'     union
+        '::2'               every other frame of the session
+        '50:'  ':50'  '7'   open ends and single frames
+        '1:300,!150:160'    exclusion
+
+    Open ends are only known once bound to a session's frames, so a spec is parsed once
+    then bound to the frame index with bind(), which resolves it into a bitset.
+
+    fs = FrameSet.parse('1:100,200:300').bind(session.f_first, session.f_last)
+    150 in fs  # O(1)
+    for f in fs: ...
+    """
+    __slots__ = ('spec', 'items', 'first', 'bits', 'count')
+
+    _item_re = re.compile(r'^(!?)(-?\d*)(?::(-?\d*))?(?::(\d*))?$')
+
+    def __init__(self, spec, items):
+        self.spec = spec
+        self.items = items  # (exclude, lo, hi, step), lo/hi None for open ends
+        self.first = None
+        self.bits = None
+        self.count = 0
+
+    @staticmethod
+    def parse(spec) -> "FrameSet":
+        """
+        Args:
+            spec: A spec string, a FrameSet, a (lo, hi) tuple, a range, a frame number, or None for every frame.
+        """
+        if isinstance(spec, FrameSet):
+            return spec
+        if spec is None:
+            return FrameSet(None, [(False, None, None, 1)])
+        if isinstance(spec, int):
+            return FrameSet(str(spec), [(False, spec, spec, 1)])
+        if isinstance(spec, range):
+            return FrameSet(f'{spec.start}:{spec.stop - 1}:{spec.step}', [(False, spec.start, spec.stop - 1, spec.step)])
+        if isinstance(spec, tuple):
+            lo, hi = spec
+            return FrameSet(f"{'' if lo is None else lo}:{'' if hi is None else hi}", [(False, lo, hi, 1)])
+
+        items = []
+        for item in str(spec).replace(' ', '').split(','):
+            if not item:
+                continue
+            m = FrameSet._item_re.match(item)
+            if m is None:
+                raise ValueError(f"Invalid frame spec: {item} (in {spec})")
+
+            exclude, lo, hi, step = m.groups()
+            lo = int(lo) if lo else None
+            if hi is None:  # Single frame
+                hi = lo
+            else:
+                hi = int(hi) if hi else None
+            step = int(step) if step else 1
+            if step <= 0:
+                raise ValueError(f"Invalid frame step: {item} (in {spec})")
+            items.append((exclude == '!', lo, hi, step))
+
+        if items and items[0][0]:
+            # Only exclusions, exclude from everything
+            items.insert(0, (False, None, None, 1))
+        return FrameSet(spec, items)
+
+    def bind(self, first, last, present=None) -> "FrameSet":
+        """
+        Resolve the open ends against a frame range and compile the bitset.
+        Args:
+            first: The first frame of the session
+            last: The last frame of the session
+            present: The frames which actually exist, if there may be gaps. (e.g. FrameRange.frames)
+
+        Returns: A new bound FrameSet
+        """
+        lo_bound = first
+        hi_bound = last
+        for exclude, lo, hi, step in self.items:
+            if not exclude:
+                lo_bound = min(lo_bound, lo if lo is not None else first)
+                hi_bound = max(hi_bound, hi if hi is not None else last)
+
+        bits = bytearray(max(hi_bound - lo_bound + 1, 0))
+        for exclude, lo, hi, step in self.items:
+            lo = first if lo is None else lo
+            hi = last if hi is None else hi
+            lo = max(lo, lo_bound)
+            hi = min(hi, hi_bound)
+            if hi < lo:
+                continue
+            n = len(range(lo, hi + 1, step))
+            bits[lo - lo_bound:hi - lo_bound + 1:step] = (b'\0' if exclude else b'\1') * n
+
+        if present is not None:
+            mask = bytearray(len(bits))
+            for f in present:
+                if lo_bound <= f <= hi_bound:
+                    mask[f - lo_bound] = 1
+            bits = bytearray(a & b for a, b in zip(bits, mask))
+
+        ret = FrameSet(self.spec, self.items)
+        ret.first = lo_bound
+        ret.bits = bits
+        ret.count = bits.count(1)
+        return ret
+
+    @property
+    def is_bound(self):
+        return self.bits is not None
+
+    def _check_bound(self):
+        if self.bits is None:
+            raise ValueError(f"FrameSet {self.spec} must be bound to a frame range first, see bind()")
+
+    @property
+    def lo(self) -> int | None:
+        """
+        Returns: The first selected frame.
+        """
+        self._check_bound()
+        i = self.bits.find(1)
+        return None if i < 0 else self.first + i
+
+    @property
+    def hi(self) -> int | None:
+        """
+        Returns: The last selected frame.
+        """
+        self._check_bound()
+        i = self.bits.rfind(1)
+        return None if i < 0 else self.first + i
+
+    def __contains__(self, f):
+        self._check_bound()
+        i = f - self.first
+        return 0 <= i < len(self.bits) and self.bits[i] == 1
+
+    def __iter__(self):
+        self._check_bound()
+        first = self.first
+        for i, b in enumerate(self.bits):
+            if b:
+                yield first + i
+
+    def __len__(self):
+        self._check_bound()
+        return self.count
+
+    def ranges(self) -> list[tuple[int, int]]:
+        """
+        Returns: The contiguous runs of selected frames as (lo, hi) inclusive.
+        """
+        ret = []
+        for f in self:
+            if ret and ret[-1][1] == f - 1:
+                ret[-1] = (ret[-1][0], f)
+            else:
+                ret.append((f, f))
+        return ret
+
+    @property
+    def is_contiguous(self):
+        return len(self.ranges()) <= 1
+
+    def name(self, prefix='none') -> str:
+        """
+        Returns: A file-safe name for outputs of this selection, distinct for every selection
+            '1:100'     video_1_100
+            '7'         video_f7
+            '50:'       video_50to
+            ':50'       video_to50
+            '::2'       video_all_s2
+            '!150:160'  video_all_x150_160
+        """
+        if self.spec is None:
+            return prefix
+
+        def num(v):
+            return f'm{-v}' if v < 0 else str(v)
+
+        parts = []
+        for exclude, lo, hi, step in self.items:
+            if lo is None and hi is None:
+                s = 'all'
+            elif lo is None:
+                s = f'to{num(hi)}'
+            elif hi is None:
+                s = f'{num(lo)}to'
+            elif lo == hi:
+                s = f'f{num(lo)}'
+            else:
+                s = f'{num(lo)}_{num(hi)}'
+            if step != 1:
+                s += f'_s{step}'
+            parts.append(('x' if exclude else '') + s)
+        return '_'.join([prefix, *parts])
+
+    def __repr__(self):
+        if self.bits is None:
+            return f"FrameSet({self.spec})"
+        return f"FrameSet({self.spec}, {self.lo}:{self.hi}, count={self.count})"
@@ -19,6 +19,10 @@ class Job:
         self.aborting: bool = False
         self.timestamp_post: float = time.time()
         self.timestamp_run: float = None
+        self.timestamp_done: float = None
+        self.priority: int = 0  # Lower runs first when scheduled
+        self.deadline: float = None  # Time after which the job is aborted
+        self.func = None  # Called instead of the plugin job when set, see JobScheduler.submit
         self.args: JobArgs = args
         self.queued = False
         self.running = False
@@ -34,6 +38,12 @@ class Job:
         return self.progress == 1
 
 
+    def abort(self):
+        """
+        Request the job to stop, the job code must check self.aborting cooperatively.
+        """
+        self.aborting = True
+
     def update_step(self, num=None):
         if num is None:
             num = self.progress_i + 1
@@ -49,7 +59,7 @@ class Job:
 
 
     def __repr__(self):
-        return f"Job({self.uid}, {self.jid}, {self.state.progress})"
+        return f"Job({self.uid}, {self.jid}, {self.progress})"
 
     def __str__(self):
         return self.__repr__()
@@ -0,0 +1,208 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+
+import numpy as np
+
+from . import metrics, paths
+
+ignored_args = ['job', 'session', 'dev']
+
+
+class JobCache:
+    """
+    A content-addressed cache of job results on disk.
+    Results are keyed by the jid, the baked job arguments and the content of the input images,
+    so a job which is deterministic (a pure function of those) can be skipped on a hit.
+    The least recently used results are evicted once the cache grows past max_bytes.
+
+    Arrays are stored as .npy, everything else is pickled.
+    """
+
+    def __init__(self, dirpath=None, max_bytes=4 * 1024 ** 3):
+        self.dirpath = Path(dirpath or paths.tmp / 'jobcache')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = None  # key -> (path, size) in LRU order, indexed on first use
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, jid, args, *images) -> str:
+        """
+        Returns: The cache key for a job query
+        Raises: TypeError if an argument can't be hashed by content, the query must not be cached then.
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(str(jid).encode())
+        h.update(hash_args(args))
+        for img in images:
+            h.update(hash_value(img))
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Returns: A tuple (hit, result)
+        """
+        with self.lock:
+            self._index()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                metrics.jobcache_misses.inc()
+                return False, None
+
+            path, size = entry
+            try:
+                if path.suffix == '.npy':
+                    ret = np.load(path.as_posix())
+                else:
+                    with open(path, 'rb') as f:
+                        ret = pickle.load(f)
+            except Exception:
+                # Corrupted or removed externally
+                self._drop(key)
+                self.misses += 1
+                metrics.jobcache_misses.inc()
+                return False, None
+
+            self.entries.move_to_end(key)
+            os.utime(path)
+            self.hits += 1
+            metrics.jobcache_hits.inc()
+            return True, ret
+
+    def put(self, key, value):
+        """
+        Store a job result, evicting the least recently used results if necessary.
+        Raises: The error of the serialization if the result can't be stored, nothing is left on disk then.
+        """
+        with self.lock:
+            self._index()
+            self.dirpath.mkdir(parents=True, exist_ok=True)
+            if key in self.entries:
+                self._drop(key)
+
+            if isinstance(value, np.ndarray):
+                path = self.dirpath / f'{key}.npy'
+                tmp = self.dirpath / f'{key}.tmp.npy'
+            else:
+                path = self.dirpath / f'{key}.pkl'
+                tmp = self.dirpath / f'{key}.tmp.pkl'
+
+            try:
+                if isinstance(value, np.ndarray):
+                    np.save(tmp.as_posix(), value)
+                else:
+                    with open(tmp, 'wb') as f:
+                        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except BaseException:
+                # e.g. an unpicklable result, don't leak the partial file (never indexed, so never evicted)
+                tmp.unlink(missing_ok=True)
+                raise
+
+            size = path.stat().st_size
+            self.entries[key] = (path, size)
+            self.size += size
+
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                self._drop(next(iter(self.entries)))
+
+    def clear(self):
+        with self.lock:
+            paths.rmtree(self.dirpath)
+            self.entries = OrderedDict()
+            self.size = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def _index(self):
+        if self.entries is not None:
+            return
+
+        files = []
+        if self.dirpath.exists():
+            for p in self.dirpath.iterdir():
+                if p.suffix in ('.npy', '.pkl') and not p.stem.endswith('.tmp'):
+                    st = p.stat()
+                    files.append((st.st_mtime, p, st.st_size))
+
+        self.entries = OrderedDict()
+        self.size = 0
+        for mtime, p, size in sorted(files):
+            self.entries[p.stem] = (p, size)
+            self.size += size
+
+    def _drop(self, key):
+        path, size = self.entries.pop(key)
+        self.size -= size
+        paths.rm(path)
+
+
+def hash_args(args) -> bytes:
+    """
+    A canonical hash of job arguments, independent of the attribute order.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    d = args if isinstance(args, dict) else vars(args)
+    for k in sorted(d.keys()):
+        if k in ignored_args or k.startswith('_'):
+            continue
+        h.update(k.encode())
+        h.update(hash_value(d[k]))
+    return h.digest()
+
+
+def hash_value(v) -> bytes:
+    """
+    A canonical hash of a value, arrays, tensors and images are hashed by content.
+    Raises: TypeError for other objects, their repr isn't a reliable key.
+            (it contains the id of plain objects and is truncated for large tensors)
+    """
+    from PIL import Image
+
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(v, Image.Image):
+        v = np.asarray(v)
+    elif type(v).__module__ == 'torch' and hasattr(v, 'detach'):
+        v = v.detach().cpu().numpy()
+
+    if isinstance(v, np.ndarray):
+        h.update(f'ndarray{v.shape}{v.dtype.str}'.encode())
+        h.update(memoryview(np.ascontiguousarray(v)).cast('B'))
+    elif isinstance(v, (list, tuple)):
+        h.update(type(v).__name__.encode())
+        for x in v:
+            h.update(hash_value(x))
+    elif isinstance(v, dict):
+        h.update(b'dict')
+        for k in sorted(v.keys(), key=str):
+            h.update(str(k).encode())
+            h.update(hash_value(v[k]))
+    elif v is None or isinstance(v, (bool, int, float, complex, str, bytes, Path, Enum)):
+        h.update(f'{type(v).__name__}:{v!r}'.encode())
+    else:
+        raise TypeError(f"Can't hash a {type(v).__name__} by content for the job cache")
+
+    return h.digest()
+
+
+_jobcache = None
+
+
+def get_jobcache() -> JobCache:
+    """
+    Returns: The shared job cache under paths.tmp, created on first use.
+    """
+    global _jobcache
+    if _jobcache is None:
+        _jobcache = JobCache()
+    return _jobcache
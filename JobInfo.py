@@ -9,13 +9,74 @@ from .printlib import printerr
 
 
 class JobInfo:
-    def __init__(self, jid=None, jfunc: Callable = None, plugin=None, key=None, is_alias=False):
+    def __init__(self, jid=None, jfunc: Callable = None, plugin=None, key=None, is_alias=False, deterministic=False, batch_func: Callable = None):
         self.jid = jid
-        self.func: Callable = jfunc
-        self.plugid = plugin.id
+        self.plugid = plugin.id if plugin is not None else None
         self.key = key
+        self._key_ref = None  # Group class of a job restored from a snapshot, not yet imported
         self.is_alias = is_alias
-        self.paramclass = self.determine_paramclass()
+        self.deterministic = deterministic or getattr(jfunc, '_plugjob_deterministic', False)
+        self._func: Callable = jfunc
+        self._batch_func: Callable = batch_func  # Variant processing many frames per call: batch_func(args_list, imgs) -> outputs
+        self._paramclass = None
+
+        # Jobs restored from a registry snapshot are only imported on first use,
+        # the loader is called with the plugin id and returns the plugin instance.
+        self.loader: Callable = None
+        self.funcname = jfunc.__name__ if jfunc is not None else None
+        self.batchname = batch_func.__name__ if batch_func is not None else getattr(jfunc, '_plugjob_batch', None)
+
+    @staticmethod
+    def from_snapshot(entry: dict, plugid: str, loader: Callable) -> "JobInfo":
+        """
+        Restore a job from a registry snapshot entry without importing the plugin.
+        """
+        ret = JobInfo(entry['jid'], key=entry['key'], is_alias=entry['is_alias'], deterministic=entry['deterministic'])
+        ret.plugid = plugid
+        ret._key_ref = entry['key_ref']
+        ret.loader = loader
+        ret.funcname = entry['func']
+        ret.batchname = entry['batch']
+        ret._paramclass = entry['paramclass']
+        return ret
+
+    def _load(self):
+        plugin = self.loader(self.plugid)
+        self.loader = None
+        self._func = getattr(plugin, self.funcname)
+        if self.batchname:
+            self._batch_func = getattr(plugin, self.batchname)
+
+    @property
+    def func(self) -> Callable:
+        if self.loader is not None:
+            self._load()
+        return self._func
+
+    @property
+    def batch_func(self) -> Callable:
+        if self.loader is not None:
+            self._load()
+        if self._batch_func is None and self.batchname and hasattr(self._func, '__self__'):
+            # Declared on the decorator, resolve it on the same plugin
+            self._batch_func = getattr(self._func.__self__, self.batchname)
+        return self._batch_func
+
+    @property
+    def paramclass(self):
+        if self._paramclass is None:
+            self._paramclass = self.determine_paramclass()
+        elif isinstance(self._paramclass, str):
+            self._paramclass = resolve_ref(self._paramclass)
+        return self._paramclass
+
+    @property
+    def is_loaded(self):
+        return self.loader is None
+
+    @property
+    def is_batchable(self):
+        return self.batchname is not None
 
     @property
     def short_jid(self):
@@ -75,6 +136,10 @@ class JobInfo:
         return self.paramclass(**kwargs)
 
     def get_groupclass(self):
+        if self._key_ref is not None:
+            self.key = resolve_ref(self._key_ref)
+            self._key_ref = None
+
         if self.key is not None:
             return self.key
         else:
@@ -82,4 +147,26 @@ class JobInfo:
 
 
     def __repr__(self):
-        return f"JobInfo({self.jid}, {self.plugid}->{self.func},alias={self.is_alias})"
\ No newline at end of file
+        func = self._func if self.is_loaded else self.funcname
+        return f"JobInfo({self.jid}, {self.plugid}->{func},alias={self.is_alias})"
+
+
+def get_ref(obj) -> str | None:
+    """
+    Returns: An importable reference 'module:qualname' to a class or function
+    """
+    if obj is None:
+        return None
+    return f'{obj.__module__}:{obj.__qualname__}'
+
+
+def resolve_ref(ref: str):
+    """
+    Import the object behind a reference from get_ref
+    """
+    import importlib
+    modname, qualname = ref.split(':')
+    ret = importlib.import_module(modname)
+    for part in qualname.split('.'):
+        ret = getattr(ret, part)
+    return ret
\ No newline at end of file
@@ -0,0 +1,332 @@
+import threading
+import time
+from collections import deque
+
+from . import metrics, paths
+from .Job import Job
+from .JobStats import get_jobstats, percentile
+from .MemMon import get_memmon
+from .logs import logjob, logjob_err
+
+interactive_priority = 0  # Jobs waited on by the user, can take the reserved interactive workers
+batch_priority = 10  # Renders and other bulk work
+
+
+class JobScheduler:
+    """
+    Runs queued jobs on a pool of worker threads.
+
+    - Jobs with a lower priority run first. (interactive_priority, batch_priority for renders)
+      Some workers can be reserved for interactive jobs, so they never wait behind a batch.
+    - Jobs of the same priority are taken round-robin across sessions,
+      so a long render in one session cannot starve the others.
+    - Each plugin can be limited to a number of concurrent jobs.
+    - Cancellation is cooperative: the job is flagged with Job.aborting, either by abort()
+      or when its deadline passes, and the job code is expected to check it and bail out.
+    """
+
+    def __init__(self, runner=None, workers=2, interactive_workers=1, default_limit=None, plugin_limits=None, poll_rate=10):
+        """
+        Args:
+            runner: The function which executes a job, defaults to src_core.jobs.run
+            workers: Number of worker threads
+            interactive_workers: How many additional workers only take interactive jobs (priority <= 0)
+            default_limit: Max concurrent jobs per plugin when not set in plugin_limits (None = unlimited)
+            plugin_limits: A dict of plugin id -> max concurrent jobs
+            poll_rate: How many times per second the deadlines are checked
+        """
+        self.runner = runner
+        self.default_limit = default_limit
+        self.plugin_limits = dict(plugin_limits or {})
+        self.poll_rate = poll_rate
+
+        self.cond = threading.Condition()
+        self.queues = {}  # priority -> {session key -> deque of jobs}
+        self.rotation = {}  # priority -> deque of session keys, the round-robin order
+        self.running = []
+        self.plugin_running = {}
+        self.stopping = False
+
+        # Stats
+        self.n_done = 0
+        self.n_aborted = 0
+        self.wait_times = deque(maxlen=1000)
+        self.run_times = deque(maxlen=1000)
+
+        self.threads = []
+        for i in range(workers + interactive_workers):
+            max_priority = 0 if i >= workers else None
+            t = threading.Thread(target=self._work, args=(max_priority,), name=f'JobScheduler-{i}', daemon=True)
+            t.start()
+            self.threads.append(t)
+
+        self.watchdog = threading.Thread(target=self._watch, name='JobScheduler-watchdog', daemon=True)
+        self.watchdog.start()
+
+    def set_limit(self, plugid, limit):
+        """
+        Set the max number of concurrent jobs for a plugin. (None = unlimited)
+        """
+        with self.cond:
+            self.plugin_limits[plugid] = limit
+            self.cond.notify_all()
+
+    def enqueue(self, job: Job, priority=None, timeout=None) -> Job:
+        """
+        Queue a job to run in the background.
+        Args:
+            job: The job to queue
+            priority: Overrides job.priority, lower runs first.
+            timeout: Seconds from now after which the job is aborted, overrides job.deadline.
+
+        Returns: The job
+        """
+        if priority is not None:
+            job.priority = priority
+        if timeout is not None:
+            job.deadline = time.time() + timeout
+
+        with self.cond:
+            key = self._session_key(job)
+            queues = self.queues.setdefault(job.priority, {})
+            rotation = self.rotation.setdefault(job.priority, deque())
+            if key not in queues:
+                queues[key] = deque()
+                rotation.append(key)
+
+            job.queued = True
+            job.timestamp_post = time.time()
+            queues[key].append(job)
+            self.cond.notify_all()
+
+        return job
+
+    def submit(self, fn, jid, session=None, priority=batch_priority, timeout=None) -> Job:
+        """
+        Queue a function as a job, for work which isn't a plugin job. (e.g. Session.run_batch)
+        Args:
+            fn: Called without arguments on a worker
+            jid: Name of the task, its plugin part is subject to the plugin limits
+            session: The session it belongs to, for the round-robin
+            priority: Lower runs first, defaults to batch
+            timeout: Seconds from now after which the job is aborted
+
+        Returns: The job
+        """
+        job = Job(jid, None)
+        job.session = session
+        job.func = fn
+        return self.enqueue(job, priority, timeout)
+
+    def abort(self, job: Job):
+        """
+        Cancel a job, it is removed from the queue or flagged for abortion if it is already running.
+        """
+        with self.cond:
+            job.abort()
+            if job.queued:
+                self._remove(job)
+                self.n_aborted += 1
+
+    def abort_session(self, session):
+        """
+        Cancel every queued and running job of a session.
+        """
+        with self.cond:
+            for job in self.jobs():
+                if job.session is session:
+                    self.abort(job)
+
+    def jobs(self):
+        """
+        Returns: All queued and running jobs
+        """
+        with self.cond:
+            ret = list(self.running)
+            for queues in self.queues.values():
+                for q in queues.values():
+                    ret.extend(q)
+            return ret
+
+    def stats(self):
+        """
+        Returns: A dict with the queue depths and latencies. (seconds)
+        """
+        with self.cond:
+            depths = {p: sum(len(q) for q in queues.values()) for p, queues in self.queues.items()}
+            waits = sorted(self.wait_times)
+            runs = sorted(self.run_times)
+            return dict(queued=sum(depths.values()),
+                        queued_by_priority=depths,
+                        running=len(self.running),
+                        running_by_plugin=dict(self.plugin_running),
+                        done=self.n_done,
+                        aborted=self.n_aborted,
+                        wait_p50=percentile(waits, 50),
+                        wait_p95=percentile(waits, 95),
+                        run_p50=percentile(runs, 50),
+                        run_p95=percentile(runs, 95))
+
+    def stop(self, abort=True):
+        """
+        Stop the workers, optionally aborting the running jobs.
+        """
+        with self.cond:
+            self.stopping = True
+            if abort:
+                for job in self.running:
+                    job.abort()
+            self.cond.notify_all()
+
+        for t in self.threads:
+            t.join()
+
+    # region Internals
+    @staticmethod
+    def _session_key(job):
+        return id(job.session) if job.session is not None else None
+
+    @staticmethod
+    def _plugid(job):
+        plug, _ = paths.split_jid(job.jid, True)
+        return plug or job.jid
+
+    def _limit(self, plugid):
+        return self.plugin_limits.get(plugid, self.default_limit)
+
+    def _remove(self, job):
+        queues = self.queues.get(job.priority, {})
+        key = self._session_key(job)
+        q = queues.get(key)
+        if q and job in q:
+            q.remove(job)
+            if not q:
+                del queues[key]
+                self.rotation[job.priority].remove(key)
+        job.queued = False
+
+    def _pop(self, max_priority=None):
+        """
+        Take the next runnable job, or None. Must be called with the lock held.
+        """
+        for priority in sorted(self.queues.keys()):
+            if max_priority is not None and priority > max_priority:
+                break
+
+            queues = self.queues[priority]
+            rotation = self.rotation[priority]
+            for _ in range(len(rotation)):
+                key = rotation[0]
+                rotation.rotate(-1)
+                q = queues[key]
+                for job in q:
+                    plugid = self._plugid(job)
+                    limit = self._limit(plugid)
+                    if limit is None or self.plugin_running.get(plugid, 0) < limit:
+                        q.remove(job)
+                        if not q:
+                            del queues[key]
+                            rotation.remove(key)
+                        return job
+
+            if not queues:
+                del self.queues[priority]
+                del self.rotation[priority]
+
+        return None
+
+    def _work(self, max_priority):
+        while True:
+            with self.cond:
+                job = None
+                while not self.stopping:
+                    job = self._pop(max_priority)
+                    if job is not None:
+                        break
+                    self.cond.wait()
+
+                if job is None:
+                    return
+
+                plugid = self._plugid(job)
+                self.plugin_running[plugid] = self.plugin_running.get(plugid, 0) + 1
+                self.running.append(job)
+                job.queued = False
+                job.running = True
+                job.thread = threading.current_thread()
+                job.timestamp_run = time.time()
+                self.wait_times.append(job.timestamp_run - job.timestamp_post)
+
+            # Functions from submit() account for the jobs they run themselves
+            memmon = get_memmon() if job.func is None else None
+            in_bytes = None
+            if memmon is not None:
+                in_bytes = job.session.input_nbytes() if job.session is not None else None
+                memmon.monitor()
+
+            ret = None
+            cpu = time.thread_time()
+            try:
+                if not job.aborting:
+                    ret = self._run(job)
+            except Exception as e:
+                logjob_err(f"Job {job.jid} failed: {e}")
+            finally:
+                mem = memmon.stop() if memmon is not None else {}
+                with self.cond:
+                    job.running = False
+                    job.thread = None
+                    job.timestamp_done = time.time()
+                    self.running.remove(job)
+                    self.plugin_running[plugid] -= 1
+                    self.run_times.append(job.timestamp_done - job.timestamp_run)
+                    if job.aborting:
+                        self.n_aborted += 1
+                    else:
+                        self.n_done += 1
+                        get_jobstats().record(job.jid,
+                                              wait=job.timestamp_run - job.timestamp_post,
+                                              run=job.timestamp_done - job.timestamp_run,
+                                              cpu=time.thread_time() - cpu,
+                                              peak_mem=mem.get('max_rss') or mem.get('active_peak'),
+                                              in_bytes=in_bytes,
+                                              out_bytes=getattr(ret, 'nbytes', None))
+                    self.cond.notify_all()
+
+    def _run(self, job):
+        if job.func is not None:
+            return job.func()
+
+        runner = self.runner
+        if runner is None:
+            from src_core import jobs
+            runner = jobs.run
+
+        return runner(job)
+
+    def _watch(self):
+        while not self.stopping:
+            time.sleep(1 / self.poll_rate)
+
+            now = time.time()
+            with self.cond:
+                for job in self.jobs():
+                    if job.deadline is not None and now > job.deadline and not job.aborting:
+                        logjob(f"Job {job.jid} passed its deadline, aborting ...")
+                        self.abort(job)
+    # endregion
+
+
+_scheduler = None
+
+
+def get_scheduler() -> JobScheduler:
+    """
+    Returns: The shared scheduler, created on first use.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler()
+        metrics.jobs_queued.set_function(lambda: _scheduler.stats()['queued'])
+        metrics.jobs_running.set_function(lambda: len(_scheduler.running))
+    return _scheduler
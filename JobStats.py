@@ -0,0 +1,122 @@
+import json
+import threading
+from collections import deque
+from pathlib import Path
+
+fields = ['wait', 'run', 'cpu', 'peak_mem', 'in_bytes', 'out_bytes']
+
+
+class JobStats:
+    """
+    Rolling statistics of the job executions, per jid.
+    Each execution records its queue wait, run time and CPU time (seconds),
+    peak memory and input/output image sizes (bytes). Only the last `window` executions are kept per jid.
+
+    stats = get_jobstats()
+    stats.summary('sd.txt2img')['run']['p95']
+    stats.eta('sd.txt2img', 120)
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self.lock = threading.Lock()
+        self.records = {}  # jid -> deque of dicts
+        self.totals = {}  # jid -> number of executions, including the ones out of the window
+
+    def record(self, jid, **values):
+        """
+        Record a job execution, the values are any of the stat fields.
+        """
+        with self.lock:
+            if jid not in self.records:
+                self.records[jid] = deque(maxlen=self.window)
+                self.totals[jid] = 0
+            self.records[jid].append(values)
+            self.totals[jid] += 1
+
+    def jids(self):
+        with self.lock:
+            return list(self.records.keys())
+
+    def summary(self, jid):
+        """
+        Returns: field -> dict(n, mean, p50, p95, max) for a jid, or None if it never ran.
+        """
+        with self.lock:
+            records = list(self.records.get(jid, []))
+
+        if not records:
+            return None
+
+        ret = {}
+        for field in fields:
+            values = sorted(r[field] for r in records if r.get(field) is not None)
+            if not values:
+                continue
+            ret[field] = dict(n=len(values),
+                              mean=sum(values) / len(values),
+                              p50=percentile(values, 50),
+                              p95=percentile(values, 95),
+                              max=values[-1])
+        return ret
+
+    def eta(self, jid, n=1, pct=50):
+        """
+        Returns: The predicted seconds to run a job n times, or None if it never ran.
+        """
+        with self.lock:
+            values = sorted(r['run'] for r in self.records.get(jid, []) if r.get('run') is not None)
+
+        if not values:
+            return None
+        return percentile(values, pct) * n
+
+    def table(self):
+        """
+        Returns: A printable table of the run times and memory of every jid, slowest first.
+        """
+        rows = []
+        for jid in self.jids():
+            s = self.summary(jid)
+            if s and 'run' in s:
+                rows.append((s['run']['p50'], jid, s))
+
+        lines = [f"{'jid':30} {'n':>6} {'run p50':>9} {'run p95':>9} {'cpu p50':>9} {'wait p95':>9} {'peak mem':>9}"]
+        for _, jid, s in sorted(rows, reverse=True, key=lambda r: r[0]):
+            def get(field, p):
+                return s[field][p] if field in s else 0
+
+            lines.append(f"{jid:30} {self.totals[jid]:>6} "
+                         f"{get('run', 'p50'):>8.3f}s {get('run', 'p95'):>8.3f}s {get('cpu', 'p50'):>8.3f}s "
+                         f"{get('wait', 'p95'):>8.3f}s {get('peak_mem', 'max') / 1024 ** 2:>7.0f}MB")
+        return '\n'.join(lines)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({jid: self.summary(jid) for jid in self.jids()}, f, indent=1)
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list, or None if empty.
+    """
+    if not sorted_values:
+        return None
+
+    i = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[i]
+
+
+_jobstats = None
+
+
+def get_jobstats() -> JobStats:
+    """
+    Returns: The shared job statistics, created on first use.
+    """
+    global _jobstats
+    if _jobstats is None:
+        _jobstats = JobStats()
+    return _jobstats
@@ -2,11 +2,10 @@ import threading
 import time
 from collections import defaultdict
 
-import torch
-
 
 class MemMon(threading.Thread):
     def __init__(self, name, device, poll_rate=1):
+        import torch
         threading.Thread.__init__(self)
         self.name = name
         self.device = device
@@ -16,6 +15,7 @@ class MemMon(threading.Thread):
         self.data = defaultdict(int)
         self.poll_rate = poll_rate
         self.disabled = False
+        self.closed = False
 
         try:
             torch.cuda.mem_get_info()
@@ -25,11 +25,14 @@ class MemMon(threading.Thread):
             self.disabled = True
 
     def run(self):
+        import torch
         if self.disabled:
             return
 
         while True:
             self.run_flag.wait()
+            if self.closed:
+                return
 
             torch.cuda.reset_peak_memory_stats()
             self.data.clear()
@@ -40,13 +43,14 @@ class MemMon(threading.Thread):
 
             self.data["min_free"] = torch.cuda.mem_get_info()[0]
 
-            while self.run_flag.is_set():
+            while self.run_flag.is_set() and not self.closed:
                 free, total = torch.cuda.mem_get_info()  # calling with self.device errors, torch bug?
                 self.data["min_free"] = min(self.data["min_free"], free)
 
                 time.sleep(1 / self.poll_rate)
 
     def dump_debug(self):
+        import torch
         print(self, 'recorded data:')
         for k, v in self.read().items():
             print(k, -(v // -(1024 ** 2)))
@@ -64,6 +68,7 @@ class MemMon(threading.Thread):
         self.run_flag.set()
 
     def read(self):
+        import torch
         if not self.disabled:
             free, total = torch.cuda.mem_get_info()
             self.data["total"] = total
@@ -78,3 +83,56 @@ class MemMon(threading.Thread):
     def stop(self):
         self.run_flag.clear()
         return self.read()
+
+    def close(self):
+        """
+        End the polling thread for good.
+        """
+        self.closed = True
+        self.run_flag.set()
+
+
+def make_memmon(name, device=None, poll_rate=1):
+    """
+    Returns: A CUDA memory monitor if CUDA is available, otherwise a process memory monitor.
+    """
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return MemMon(name, device, poll_rate)
+    except ImportError:
+        pass
+
+    from .ProcMemMon import ProcMemMon
+    return ProcMemMon(name, device, poll_rate)
+
+
+job_poll_rate = 20  # Polls per second of the job monitors, so jobs shorter than a second still get a peak
+
+_memmon_local = threading.local()
+
+
+class _MemmonOwner:
+    """
+    Held by a thread's local storage, closes the thread's monitor when the thread exits.
+    """
+
+    def __init__(self, mon):
+        self.mon = mon
+
+    def __del__(self):
+        self.mon.close()
+
+
+def get_memmon():
+    """
+    Returns: The memory monitor of the calling thread for job accounting, created and started on first use.
+             Each thread has its own, so concurrent jobs don't clear each other's data.
+    """
+    owner = getattr(_memmon_local, 'owner', None)
+    if owner is None:
+        mon = make_memmon(f'jobs-{threading.current_thread().name}', poll_rate=job_poll_rate)
+        mon.start()
+        owner = _MemmonOwner(mon)
+        _memmon_local.owner = owner
+    return owner.mon
@@ -45,18 +45,21 @@ class Plugin:
         """
         Returns: The resource directory for this plugin
         """
+        paths.ensure_dirs()
         return paths.plug_res / self.id / join
 
     def logs(self, join='') -> Path:
         """
         Returns: The log directory for this plugin
         """
+        paths.ensure_dirs()
         return paths.plug_logs / self.id / join
 
     def repo(self, join):
         """
         Returns: The git repo dependencies directory for this plugin
         """
+        paths.ensure_dirs()
         return paths.plug_repos / self.id / join
 
     def title(self):
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+from . import paths
+from .JobInfo import JobInfo, get_ref, resolve_ref
+from .logs import logplugin, logplugin_err
+
+snapshot_version = 1
+
+
+class PluginRegistry:
+    """
+    A persisted snapshot of the installed plugins and their jobs, so that startup
+    can list every job without importing the plugin modules or inspecting signatures.
+
+    Each plugin entry is invalidated by a signature of its sources (path, size and mtime of every .py file),
+    jobs restored from a fresh entry import their plugin on first use. (see JobInfo.from_snapshot)
+
+    registry = PluginRegistry()
+    for dirpath in plugin_dirs:
+        plugid = dirpath.stem
+        if registry.is_fresh(plugid, dirpath):
+            jobs = registry.jobinfos(plugid)
+        else:
+            plugin = <import and instantiate>
+            registry.record(plugin)
+    registry.save()
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or paths.tmp / 'plugin-registry.json')
+        self.entries = {}  # plugid -> entry
+        self.instances = {}  # plugid -> Plugin, for the default loader
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        data = None
+        if self.path.is_file():
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except Exception as e:
+                logplugin_err(f"Could not read the plugin registry snapshot ({e}), rebuilding ...")
+
+        if data and data.get('version') == snapshot_version and data.get('python') == sys.version:
+            self.entries = data['plugins']
+        else:
+            self.entries = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(dict(version=snapshot_version, python=sys.version, plugins=self.entries), f, indent=1)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def is_fresh(self, plugid, dirpath=None) -> bool:
+        """
+        Returns: Whether the snapshot of a plugin matches its sources on disk
+        """
+        entry = self.entries.get(plugid)
+        if entry is None:
+            return False
+
+        dirpath = dirpath or entry['dir']
+        return entry['dir'] == Path(dirpath).as_posix() and entry['signature'] == source_signature(dirpath)
+
+    def record(self, plugin, dirpath=None):
+        """
+        Snapshot a loaded plugin and its jobs.
+        """
+        dirpath = Path(dirpath or plugin._dir)
+        jobs = []
+        for ifo in plugin.jobs:
+            key = ifo.key
+            jobs.append(dict(jid=ifo.jid,
+                             func=ifo.funcname,
+                             batch=ifo.batchname,
+                             key=key if not isinstance(key, type) else None,
+                             key_ref=get_ref(key) if isinstance(key, type) else None,
+                             is_alias=ifo.is_alias,
+                             deterministic=ifo.deterministic,
+                             paramclass=get_ref(ifo.paramclass)))
+
+        self.entries[plugin.id] = dict(id=plugin.id,
+                                       dir=dirpath.as_posix(),
+                                       cls=get_ref(type(plugin)),
+                                       signature=source_signature(dirpath),
+                                       jobs=jobs)
+        self.instances[plugin.id] = plugin
+        self.dirty = True
+
+    def forget(self, plugid):
+        if self.entries.pop(plugid, None) is not None:
+            self.dirty = True
+
+    def plugids(self):
+        return list(self.entries.keys())
+
+    def jobinfos(self, plugid, loader=None) -> list[JobInfo]:
+        """
+        Restore the jobs of a plugin from the snapshot, without importing it.
+        Args:
+            plugid: The plugin id
+            loader: A function plugid -> Plugin instance, called on the first use of a job.
+                    Defaults to importing and instantiating the plugin class from the snapshot.
+        """
+        loader = loader or self.load_plugin
+        entry = self.entries[plugid]
+        return [JobInfo.from_snapshot(job, plugid, loader) for job in entry['jobs']]
+
+    def load_plugin(self, plugid):
+        """
+        The default loader, imports and instantiates a plugin from its snapshot entry.
+        """
+        if plugid in self.instances:
+            return self.instances[plugid]
+
+        entry = self.entries[plugid]
+        logplugin(f"Importing {plugid} ...")
+        cls = resolve_ref(entry['cls'])
+        plugin = cls(dirpath=entry['dir'])
+        plugin.init()
+
+        self.instances[plugid] = plugin
+        return plugin
+
+
+def source_signature(dirpath) -> str | None:
+    """
+    A hash of the path, size and mtime of every python source under a plugin directory.
+    """
+    dirpath = Path(dirpath)
+    if not dirpath.exists():
+        return None
+
+    h = hashlib.blake2b(digest_size=16)
+    for parent, dirs, files in os.walk(dirpath):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__' and not d.startswith('.'))
+        for file in sorted(files):
+            if file.endswith('.py'):
+                st = os.stat(os.path.join(parent, file))
+                h.update(f'{os.path.relpath(os.path.join(parent, file), dirpath)}:{st.st_size}:{st.st_mtime_ns};'.encode())
+
+    return h.hexdigest()
@@ -5,7 +5,13 @@ class PlugjobDeco:
     with an actual function.
     """
 
-    def __init__(self, func, group=None, aliases=None):
+    def __init__(self, func, group=None, aliases=None, deterministic=False, batch=None):
         self.func = func
         self.aliases = aliases
         self.key = group
+        self.deterministic = deterministic  # The output only depends on the args and input image, so it can be cached
+        self.batch = batch  # Name of the batch-capable variant of the job, used by Session.run_batch
+
+        # Also carried by the function, which is what the plugin loader builds the JobInfo from
+        func._plugjob_deterministic = deterministic
+        func._plugjob_batch = batch
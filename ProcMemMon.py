@@ -0,0 +1,152 @@
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+
+class ProcMemMon(threading.Thread):
+    """
+    A CPU memory monitor with the same interface as MemMon, for nodes without CUDA.
+    Tracks the process RSS/PSS from /proc, the peak resident memory,
+    and optionally the top allocators with tracemalloc.
+
+    mon.monitor()    # start recording, e.g. before a job
+    ...
+    data = mon.stop()  # data['rss_delta'], data['max_rss'], ...
+    """
+
+    def __init__(self, name, device=None, poll_rate=1, tracemalloc_top=0):
+        """
+        Args:
+            name: Name of the monitor
+            device: Unused, for compatibility with MemMon
+            poll_rate: RSS polls per second while monitoring, to catch the peaks between read()
+            tracemalloc_top: Number of top allocators to report, 0 to disable tracemalloc (it slows down allocations)
+        """
+        threading.Thread.__init__(self)
+        self.name = name
+        self.device = device
+
+        self.daemon = True
+        self.run_flag = threading.Event()
+        self.data = defaultdict(int)
+        self.poll_rate = poll_rate
+        self.tracemalloc_top = tracemalloc_top
+        self.disabled = False
+        self.closed = False
+
+        self.baseline = 0
+        self.snapshot = None
+        self.started_tracing = False  # Whether tracemalloc was started by us, so stop() turns it back off
+
+        try:
+            read_status()
+        except Exception as e:  # Not linux
+            print(f"Warning: caught exception '{e}', memory monitor disabled")
+            self.disabled = True
+
+    def run(self):
+        if self.disabled:
+            return
+
+        while True:
+            self.run_flag.wait()
+            if self.closed:
+                return
+
+            if self.poll_rate <= 0:
+                self.run_flag.clear()
+                continue
+
+            while self.run_flag.is_set() and not self.closed:
+                rss = read_status().get('VmRSS', 0)
+                self.data["max_rss"] = max(self.data["max_rss"], rss)
+
+                time.sleep(1 / self.poll_rate)
+
+    def dump_debug(self):
+        print(self, 'recorded data:')
+        for k, v in self.read().items():
+            if k == 'tracemalloc_top':
+                continue
+            print(k, -(v // -(1024 ** 2)))
+
+        for line in self.data.get('tracemalloc_top', []):
+            print('\t', line)
+
+    def monitor(self):
+        self.data.clear()
+        if not self.disabled:
+            self.baseline = read_status().get('VmRSS', 0)
+            self.data["max_rss"] = self.baseline
+
+            if self.tracemalloc_top:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self.started_tracing = True
+                self.snapshot = tracemalloc.take_snapshot()
+
+        self.run_flag.set()
+
+    def read(self):
+        if not self.disabled:
+            status = read_status()
+            rss = status.get('VmRSS', 0)
+            self.data["rss"] = rss
+            self.data["peak_rss"] = status.get('VmHWM', 0)  # Over the whole process lifetime
+            self.data["max_rss"] = max(self.data["max_rss"], rss)
+            self.data["rss_delta"] = rss - self.baseline
+            self.data["max_rss_delta"] = self.data["max_rss"] - self.baseline
+
+            pss = read_pss()
+            if pss is not None:
+                self.data["pss"] = pss
+
+            if self.snapshot is not None:
+                stats = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+                self.data["tracemalloc_top"] = [str(s) for s in stats[:self.tracemalloc_top]]
+
+        return self.data
+
+    def stop(self):
+        self.run_flag.clear()
+        ret = self.read()
+        self.snapshot = None
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        return ret
+
+    def close(self):
+        """
+        End the polling thread for good.
+        """
+        self.closed = True
+        self.run_flag.set()
+
+
+def read_status():
+    """
+    Returns: The memory fields of /proc/self/status in bytes (VmRSS, VmHWM, VmSize, ...)
+    """
+    ret = {}
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('Vm'):
+                k, v = line.split(':', 1)
+                ret[k] = int(v.split()[0]) * 1024
+    return ret
+
+
+def read_pss():
+    """
+    Returns: The proportional set size in bytes, or None if the kernel doesn't report it.
+    """
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
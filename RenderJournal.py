@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+png_end = b'\x00\x00\x00\x00IEND\xaeB`\x82'
+jpg_end = b'\xff\xd9'
+
+
+class RenderJournal:
+    """
+    An append-only log of the frames a session has committed, one line per frame:
+        <frame> <filename> <size> <hash or ->
+
+    Frames are written atomically (see convert.atomic_write) then committed here,
+    so after a crash the last committed frame is read from the tail of the journal in O(1),
+    and anything written after it is checked for truncation instead of trusted.
+
+    journal = RenderJournal(session.dirpath)
+    journal.commit(12, path)
+    journal.last()  # -> (12, '00000012.png', 1834211, '-')
+    """
+
+    def __init__(self, dirpath, hash=False, fsync=False):
+        """
+        Args:
+            dirpath: The session directory
+            hash: Record a content hash of each frame (costs a read of the file)
+            fsync: Flush each commit to disk, to survive power loss rather than only a crashed process
+        """
+        self.path = Path(dirpath) / 'journal.log'
+        self.hash = hash
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self._tail_checked = False
+
+    def commit(self, f, path):
+        """
+        Record a frame as completely written.
+        """
+        path = Path(path)
+        size = path.stat().st_size
+        digest = hash_file(path) if self.hash else '-'
+        line = f'{f} {path.name} {size} {digest}\n'
+
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if not self._tail_checked:
+                # Don't append to a line torn by a crash
+                if self.path.exists() and self.path.stat().st_size > 0:
+                    with open(self.path, 'rb') as fp:
+                        fp.seek(-1, os.SEEK_END)
+                        if fp.read(1) != b'\n':
+                            line = '\n' + line
+                self._tail_checked = True
+
+            with open(self.path, 'a') as fp:
+                fp.write(line)
+                if self.fsync:
+                    fp.flush()
+                    os.fsync(fp.fileno())
+
+    def last(self) -> tuple[int, str, int, str] | None:
+        """
+        Returns: The last committed (frame, filename, size, hash), or None if nothing was committed.
+        """
+        try:
+            with open(self.path, 'rb') as fp:
+                fp.seek(0, os.SEEK_END)
+                end = fp.tell()
+                fp.seek(max(0, end - 4096))
+                lines = fp.read().decode(errors='replace').splitlines()
+        except FileNotFoundError:
+            return None
+
+        # The last line may itself be cut short by a crash
+        for line in reversed(lines):
+            parts = line.split()
+            if len(parts) == 4 and parts[0].isdigit() and parts[2].isdigit():
+                return int(parts[0]), parts[1], int(parts[2]), parts[3]
+        return None
+
+    def is_valid(self, path, size=None, digest=None) -> bool:
+        """
+        Check a frame file against its journal entry, or if it has none, that it isn't truncated.
+        """
+        path = Path(path)
+        try:
+            actual = path.stat().st_size
+        except FileNotFoundError:
+            return False
+
+        if size is not None and actual != size:
+            return False
+        if digest is not None and digest != '-' and hash_file(path) != digest:
+            return False
+        return size is not None or is_complete(path)
+
+    def reset(self):
+        """
+        Forget every commit, e.g. after the frames were renumbered.
+        """
+        with self.lock:
+            if self.path.exists():
+                self.path.unlink()
+            self._tail_checked = True
+
+
+def is_complete(path) -> bool:
+    """
+    Returns: Whether an image file has its end marker, i.e. wasn't cut short mid-write.
+    """
+    path = Path(path)
+    try:
+        with open(path, 'rb') as fp:
+            fp.seek(0, os.SEEK_END)
+            size = fp.tell()
+            if path.suffix == '.png':
+                fp.seek(max(0, size - len(png_end)))
+                return fp.read() == png_end
+            if path.suffix in ('.jpg', '.jpeg'):
+                fp.seek(max(0, size - 2))
+                return fp.read() == jpg_end
+            return size > 0
+    except OSError:
+        return False
+
+
+def hash_file(path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
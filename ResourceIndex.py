@@ -0,0 +1,140 @@
+import os
+import threading
+from pathlib import Path
+
+from .FrameRange import FrameRange
+
+
+class ResourceIndex:
+    """
+    An in-memory index of directory listings, to answer the existence checks of
+    Session.res and friends without probing the filesystem for every candidate.
+
+    Each directory is listed once and re-listed only when its mtime changes,
+    so a lookup costs a single stat of the directory instead of one per candidate path.
+    Writes we make ourselves are recorded with add() to avoid re-listing large frame directories.
+
+    index.exists(session.dirpath / 'init.mp4')
+    index.find(session.dirpath, 'music', ['.mp3', '.ogg'])  # -> first existing variant
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dirs = {}  # dirpath -> (mtime_ns, files, subdirs)
+        self.ranges = {}  # dirpath -> (mtime_ns, FrameRange)
+
+    def _get(self, dirpath: Path):
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns
+        except OSError:
+            with self.lock:
+                self.dirs.pop(dirpath, None)
+            return None
+
+        entry = self.dirs.get(dirpath)
+        if entry is not None and entry[0] == mtime:
+            return entry
+
+        files = set()
+        subdirs = set()
+        try:
+            for e in os.scandir(dirpath):
+                if e.is_dir():
+                    subdirs.add(e.name)
+                else:
+                    files.add(e.name)
+        except NotADirectoryError:
+            return None
+
+        entry = (mtime, files, subdirs)
+        with self.lock:
+            self.dirs[dirpath] = entry
+        return entry
+
+    def exists(self, path) -> bool:
+        path = Path(path)
+        entry = self._get(path.parent)
+        return entry is not None and (path.name in entry[1] or path.name in entry[2])
+
+    def is_file(self, path) -> bool:
+        path = Path(path)
+        entry = self._get(path.parent)
+        return entry is not None and path.name in entry[1]
+
+    def is_dir(self, path) -> bool:
+        path = Path(path)
+        entry = self._get(path.parent)
+        return entry is not None and path.name in entry[2]
+
+    def listdir(self, dirpath) -> list[str]:
+        """
+        Returns: The names of the files in a directory, or an empty list if it doesn't exist.
+        """
+        entry = self._get(Path(dirpath))
+        return list(entry[1]) if entry is not None else []
+
+    def variants(self, dirpath, stem) -> list[Path]:
+        """
+        Returns: Every file named stem in a directory, regardless of the extension.
+        """
+        dirpath = Path(dirpath)
+        return [dirpath / name for name in self.listdir(dirpath) if os.path.splitext(name)[0] == stem]
+
+    def find(self, dirpath, stem, exts) -> Path | None:
+        """
+        Returns: The first existing file stem+ext in a directory, in the order of exts.
+        """
+        dirpath = Path(dirpath)
+        entry = self._get(dirpath)
+        if entry is None:
+            return None
+        for ext in exts:
+            name = stem + ext
+            if name in entry[1]:
+                return dirpath / name
+        return None
+
+    def frame_range(self, dirpath) -> FrameRange | None:
+        """
+        Returns: The numbered frames of a sequence directory, or None if it doesn't exist.
+        """
+        dirpath = Path(dirpath)
+        entry = self._get(dirpath)
+        if entry is None:
+            return None
+
+        cached = self.ranges.get(dirpath)
+        if cached is not None and cached[0] == entry[0]:
+            return cached[1]
+
+        ret = FrameRange.from_names(entry[1])
+        with self.lock:
+            self.ranges[dirpath] = (entry[0], ret)
+        return ret
+
+    def add(self, path):
+        """
+        Record a file we just wrote, so the directory doesn't need to be listed again.
+        """
+        path = Path(path)
+        with self.lock:
+            entry = self.dirs.get(path.parent)
+            if entry is None:
+                return
+            try:
+                mtime = os.stat(path.parent).st_mtime_ns
+            except OSError:
+                self.dirs.pop(path.parent, None)
+                return
+            entry[1].add(path.name)
+            self.dirs[path.parent] = (mtime, entry[1], entry[2])
+            self.ranges.pop(path.parent, None)
+
+    def invalidate(self, dirpath=None):
+        with self.lock:
+            if dirpath is None:
+                self.dirs.clear()
+                self.ranges.clear()
+            else:
+                self.dirs.pop(Path(dirpath), None)
+                self.ranges.pop(Path(dirpath), None)
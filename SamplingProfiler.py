@@ -0,0 +1,179 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import paths
+from .logs import logcore
+
+_run_counter = itertools.count(1)
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    A statistical profiler which samples the stacks of every thread from a background thread,
+    light enough to leave on during long renders.
+
+    The samples are aggregated into collapsed stacks ('thread;outer;...;inner count' per line),
+    which flamegraph.pl, speedscope or inferno can read directly.
+    The sampling interval stretches whenever a sample costs more than max_overhead of the interval.
+
+    profiler = SamplingProfiler.for_session(session)
+    profiler.start()
+    ...
+    profiler.stop()  # -> paths.tmp/profiles/<session>_<YYYYmmdd_HHMMSS>_<pid>_<n>.collapsed
+
+    Each run writes its own file, so separate renders can be compared against each other.
+    """
+
+    def __init__(self, name='profile', rate=100, max_overhead=0.02, dirpath=None, flush_interval=60):
+        """
+        Args:
+            name: Name of the output file
+            rate: Samples per second
+            max_overhead: Max fraction of time spent sampling
+            dirpath: Output directory, defaults to paths.tmp/profiles
+            flush_interval: Seconds between writes to disk, so the profile survives a crash
+        """
+        threading.Thread.__init__(self)
+        self.name = f'SamplingProfiler-{name}'
+        self.daemon = True
+
+        self.profile_name = name
+        # Unique per run, even for runs starting within the same second
+        self.run_name = f'{name}_{time.strftime("%Y%m%d_%H%M%S")}_{os.getpid()}_{next(_run_counter)}'
+        self.rate = rate
+        self.max_overhead = max_overhead
+        self.dirpath = Path(dirpath or paths.tmp / 'profiles')
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.stop_flag = threading.Event()
+        self.counts = Counter()
+        self.labels = {}  # code object -> frame label
+        self.n_samples = 0
+        self.sample_time = 0
+        self.t_start = None
+        self.interval = 1 / rate
+
+    @staticmethod
+    def for_session(session, **kwargs) -> "SamplingProfiler":
+        return SamplingProfiler(session.name, **kwargs)
+
+    @property
+    def path(self):
+        return self.dirpath / f'{self.run_name}.collapsed'
+
+    @property
+    def overhead(self):
+        """
+        Returns: The measured fraction of time spent sampling
+        """
+        if self.t_start is None:
+            return 0
+        return self.sample_time / max(time.perf_counter() - self.t_start, 1e-9)
+
+    def run(self):
+        self.t_start = time.perf_counter()
+        last_flush = self.t_start
+        while not self.stop_flag.is_set():
+            start = time.perf_counter()
+            self.sample()
+            cost = time.perf_counter() - start
+
+            self.n_samples += 1
+            self.sample_time += cost
+            self.interval = max(1 / self.rate, cost / self.max_overhead)
+
+            if start - last_flush > self.flush_interval:
+                self.dump()
+                last_flush = start
+
+            self.stop_flag.wait(max(0.0, self.interval - cost))
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = []
+        for tid, frame in sys._current_frames().items():
+            if tid == own:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(tid, str(tid)))
+            stack.reverse()
+            stacks.append(';'.join(stack))
+
+        with self.lock:
+            self.counts.update(stacks)
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+            self.labels[code] = label
+        return label
+
+    def dump(self):
+        """
+        Merge the samples so far into this run's output file, then reset them.
+        """
+        with self.lock:
+            counts = self.counts
+            self.counts = Counter()
+
+        if not counts:
+            return self.path
+
+        # Merge with the previous flushes of this run
+        if self.path.is_file():
+            with open(self.path, 'r') as f:
+                for line in f:
+                    stack, _, n = line.rstrip('\n').rpartition(' ')
+                    if stack:
+                        counts[stack] += int(n)
+
+        self.dirpath.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            for stack, n in counts.most_common():
+                f.write(f'{stack} {n}\n')
+        os.replace(tmp, self.path)
+
+        return self.path
+
+    def stop(self):
+        """
+        Stop sampling and write the profile.
+        Returns: The path of the profile
+        """
+        self.stop_flag.set()
+        if self.is_alive():
+            self.join()
+        return self.dump()
+
+
+@contextmanager
+def profiling(name, enable=True, **kwargs):
+    """
+    Sample the stacks for the duration of the block, if enabled.
+    Returns: The profiler, or None when disabled
+    """
+    if not enable:
+        yield None
+        return
+
+    profiler = SamplingProfiler(name, **kwargs)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        path = profiler.stop()
+        logcore(f"Sampling profile: {path} ({profiler.n_samples} samples, {profiler.overhead:.2%} overhead)")
@@ -0,0 +1,134 @@
+import numpy as np
+
+# Vectorized easing functions over t in [0, 1]
+easings = {
+    'linear': lambda t: t,
+    'step': lambda t: (t >= 1).astype(t.dtype),  # Holds each value until the next keyframe
+    'smooth': lambda t: t * t * (3 - 2 * t),
+    'in': lambda t: t * t,
+    'out': lambda t: 1 - (1 - t) * (1 - t),
+    'inout': lambda t: np.where(t < .5, 2 * t * t, 1 - 2 * (1 - t) * (1 - t)),
+    'sine': lambda t: .5 - .5 * np.cos(t * np.pi),
+}
+
+# Names available to string expressions
+expr_namespace = {k: getattr(np, k) for k in ['sin', 'cos', 'tan', 'abs', 'sqrt', 'exp', 'log', 'floor', 'ceil', 'minimum', 'maximum', 'clip', 'where', 'pi']}
+
+
+class Schedule:
+    """
+    A parameter curve evaluated for every frame of a render at once,
+    so a job parameter costs an array lookup per frame instead of a Python call.
+    Frames start at 1, frames past the end hold the last value.
+
+    zoom = Schedule.keyframes({1: 1.0, 120: 1.5, 240: 1.0}, n=240, ease='smooth')
+    angle = Schedule.expr('sin(t * 2) * 5', n=240, fps=24)
+    session.run('sd.img2img', zoom=zoom, angle=angle)  # Baked at session.f
+    session.set_schedule('zoom', zoom)  # Stored in the frame data, for get_frame_data
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    @staticmethod
+    def constant(v, n) -> "Schedule":
+        return Schedule(np.full(n, v))
+
+    @staticmethod
+    def keyframes(keys: dict, n=None, ease='linear') -> "Schedule":
+        """
+        Interpolate between keyframes.
+        Args:
+            keys: frame -> value
+            n: Number of frames, defaults to the last keyframe
+            ease: Easing of each segment, a name in easings or a vectorized function of t in [0, 1]
+        """
+        if not keys:
+            raise ValueError("Schedule.keyframes needs at least one keyframe")
+
+        kf = np.array(sorted(keys.keys()), dtype=np.int64)
+        kv = np.array([keys[k] for k in kf], dtype=np.float64)
+        n = n or int(kf[-1])
+        f = np.arange(1, n + 1)
+
+        if len(kf) == 1:
+            return Schedule(np.full(n, kv[0]))
+
+        easefn = easings[ease] if isinstance(ease, str) else ease
+
+        # Segment of each frame, and the position in it
+        seg = np.clip(np.searchsorted(kf, f, side='right') - 1, 0, len(kf) - 2)
+        f0 = kf[seg]
+        f1 = kf[seg + 1]
+        t = np.clip((f - f0) / (f1 - f0), 0, 1)
+        t = easefn(t)
+        return Schedule(kv[seg] + (kv[seg + 1] - kv[seg]) * t)
+
+    @staticmethod
+    def expr(e, n, fps=24) -> "Schedule":
+        """
+        Evaluate an expression over every frame.
+        Args:
+            e: A vectorized function fn(t, f) or a numpy expression string of t (seconds), f (frame) and n
+            n: Number of frames
+            fps: Frames per second for t
+        """
+        f = np.arange(1, n + 1, dtype=np.float64)
+        t = f / fps
+        if isinstance(e, str):
+            ret = eval(e, {'__builtins__': {}, 'np': np, **expr_namespace}, dict(t=t, f=f, n=n))
+        else:
+            ret = e(t, f)
+        return Schedule(np.broadcast_to(ret, f.shape).copy())
+
+    @staticmethod
+    def for_session(session, e, n=None) -> "Schedule":
+        """
+        A schedule over a session's frames, at its fps.
+        Args:
+            e: Keyframes dict, expression, or a scalar
+        """
+        n = n or max(session.f_last, session.f)
+        if isinstance(e, dict):
+            return Schedule.keyframes(e, n)
+        if isinstance(e, (int, float)):
+            return Schedule.constant(e, n)
+        return Schedule.expr(e, n, session.fps)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, f):
+        """
+        Returns: The value at frame f (1-based), clamped to the schedule.
+        """
+        n = len(self.values)
+        i = f - 1
+        if i >= n:
+            i = n - 1
+        elif i < 0:
+            i = 0
+        return self.values[i].item()
+
+    def __repr__(self):
+        return f"Schedule(n={len(self.values)}, {self.values.min():.3f}..{self.values.max():.3f})"
+
+    # Arithmetic between schedules and scalars, stays vectorized
+    def _op(self, other, fn):
+        if isinstance(other, Schedule):
+            a, b = self.values, other.values
+            if len(a) != len(b):
+                n = max(len(a), len(b))
+                a = np.pad(a, (0, n - len(a)), mode='edge')
+                b = np.pad(b, (0, n - len(b)), mode='edge')
+            return Schedule(fn(a, b))
+        return Schedule(fn(self.values, other))
+
+    def __add__(self, other): return self._op(other, np.add)
+    def __radd__(self, other): return self._op(other, np.add)
+    def __sub__(self, other): return self._op(other, np.subtract)
+    def __rsub__(self, other): return self._op(other, lambda a, b: b - a)
+    def __mul__(self, other): return self._op(other, np.multiply)
+    def __rmul__(self, other): return self._op(other, np.multiply)
+    def __truediv__(self, other): return self._op(other, np.true_divide)
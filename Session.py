@@ -4,21 +4,32 @@ import os
 import shutil
 import subprocess
 import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
-import cv2
 import numpy as np
 from munch import Munch
-from PIL import Image
-from tqdm import tqdm
 
 import jargs
 from src_plugins.disco_party.maths import clamp
-from . import convert, paths
+from . import convert, metrics, paths
+from .AudioFeatures import AudioFeatures
 from .convert import cv2pil, load_cv2, load_json, load_pil, save_json, save_png
+from .FrameRange import FrameRange
+from .FrameRing import FrameRing
+from .FrameSet import FrameSet
+from .JobCache import get_jobcache
 from .JobInfo import JobInfo
+from .JobScheduler import batch_priority, get_scheduler, interactive_priority
+from .JobStats import get_jobstats
 from .logs import logsession, logsession_err
+from .MemMon import get_memmon
+from .RenderJournal import RenderJournal
+from .ResourceIndex import ResourceIndex
+from .SamplingProfiler import profiling
+from .Schedule import Schedule
+from .SessionCatalog import get_catalog
 from .paths import get_leadnum, get_leadnum_zpad, get_max_leadnum, get_min_leadnum, get_next_leadnum, get_script_file_path, is_leadnum_zpadded, leadnum_zpad, parse_action_script, parse_frames, sessions
 from .printlib import cputrace, printerr, trace, trace_decorator
 from ..lib.corelib import shlexproc
@@ -53,12 +64,17 @@ class Session:
         self.cancel_processing = False
         self.dev = False
         self.disable_jobs = False
+        self.job_priority = None  # Scheduling priority of background jobs, lower runs first (None = interactive for run, batch for run_batch/map_frames)
+        self.job_timeout = None  # Seconds after which background jobs are aborted
+        self.cache_jobs = False  # Skip deterministic jobs whose result is already in the job cache
 
         # Context properties
         self.prompt = ''
         self.file = None
         self.fps = 24
         self._img = None
+        self._img_file = None  # File to decode into _img on first access
+        self._audio = None
 
         # Directory properties, cached for performance
         self.f = 1
@@ -69,6 +85,8 @@ class Session:
         self.f_first_path = ''
         self.f_last_path = ''
         self.suffix = ''
+        self.imginfo = None  # (w, h, channels, bitdepth) of the current file, from its header
+        self.resources = ResourceIndex()  # Directory listings for the res* lookups
 
         if Path(name_or_abspath).is_absolute():
             self.dirpath = Path(name_or_abspath)
@@ -82,11 +100,13 @@ class Session:
             return
 
         # self.dirpath = self.dirpath.resolve()
+        self.journal = RenderJournal(self.dirpath)  # Committed frames, to resume after a crash
+        paths.ensure_dirs()
 
         if self.dirpath.exists():
             if load:
                 import jargs
-                with cputrace('load', jargs.args.profile_session_load):
+                with cputrace('load', jargs.args.profile_session_load, session=self.name):
                     self.load(log=log)
         else:
             if log:
@@ -106,6 +126,7 @@ class Session:
 
     def rmtree(self):
         shutil.rmtree(self.dirpath.as_posix())
+        get_catalog().remove(self.dirpath)
 
     @staticmethod
     def now(prefix='', log=True):
@@ -122,11 +143,12 @@ class Session:
         args:
             recent_window: The number of seconds to consider a session recent. Outside of this window, a new session is created.
         """
-        if any(paths.sessions.iterdir()):
-            latest = max(paths.sessions.iterdir(), key=lambda p: p.stat().st_mtime)
+        paths.ensure_dirs()
+        latest = get_catalog().recent()
+        if latest is not None:
             # If the latest session fits into the recent window, use it
-            if (datetime.now() - datetime.fromtimestamp(latest.stat().st_mtime)).total_seconds() < recent_window:
-                return Session(latest)
+            if (datetime.now() - datetime.fromtimestamp(latest['mtime'])).total_seconds() < recent_window:
+                return Session(Path(latest['path']))
 
         return Session.now()
 
@@ -150,10 +172,10 @@ class Session:
         self.f_path = self.f_last_path
         self.f = self.f_last
         self.load_f()
-        self.load_file()
 
         # Save the session data
         self.load_data()
+        get_catalog().update(self)
 
         if log:
             if not any(self.dirpath.iterdir()):
@@ -197,8 +219,12 @@ class Session:
                 file = self.dirpath / self.file
 
             if file.suffix in paths.image_exts:
-                if file.exists():
-                    self.img = file
+                info = convert.probe_image(file)
+                if info is not None:
+                    # Decoded on first access to self.img
+                    self.imginfo = info
+                    self._img = None
+                    self._img_file = file
                     return True
 
                 return False
@@ -231,22 +257,38 @@ class Session:
             self.f_first_path = path
 
         path = Path(path)
-        if self.img is not None:
+        added_bytes = 0
+        if self._img_file is not None and self._img_file.suffix == '.png':
+            # Never decoded so unchanged, no need to encode it again
             path = path.with_suffix(".png")
-            import cv2
-            save_png(self.img, path, with_async=False)
+            if path != self._img_file:
+                with convert.atomic_write(path) as tmp:
+                    shutil.copyfile(self._img_file, tmp)
+                metrics.on_frame_saved()
+                added_bytes = path.stat().st_size
+        elif self.img is not None:
+            path = path.with_suffix(".png")
+            with metrics.save_seconds.time():
+                save_png(self.img, path, with_async=False)
+            metrics.on_frame_saved()
+            added_bytes = path.stat().st_size
+        self.resources.add(path)
+        if added_bytes and save_num is not None:
+            self.journal.commit(save_num, path)
 
         self.file = path.name
 
         # Save the session data
         self.save_data()
+        get_catalog().update(self, added_bytes=added_bytes)
 
-        logsession(f"session.save({path})")
+        logsession(lambda: f"session.save({path})")
         return self
 
     def save_data(self):
-        self.data.fps = self.fps
-        save_json(self.data, self.dirpath / "session.json")
+        with trace("save_data"):
+            self.data.fps = self.fps
+            save_json(self.data, self.dirpath / "session.json")
 
     def delete_f(self):
         return self.delete_frame(self.f)
@@ -307,25 +349,46 @@ class Session:
 
     @property
     def img(self):
-        from .convert import pil2cv
+        if self._img_file is not None:
+            file = self._img_file
+            self._img_file = None
+            with metrics.load_seconds.time():
+                self._img = convert.load_cv2(file)
+            metrics.frames_loaded.inc()
         return self._img
 
     @img.setter
     def img(self, value):
+        self._img_file = None
         self._img = convert.load_cv2(value)
+
+    @property
+    def frame(self) -> convert.Frame | None:
+        """
+        The current image as a Frame, sharing its pixels.
+        """
+        img = self.img
+        if img is None:
+            return None
+        order = 'GRAY' if img.ndim == 2 else 'RGBA' if img.shape[2] == 4 else 'RGB'
+        return convert.Frame(img, order, self.dirpath / self.file if self.file else None)
         # value = cv2.resize(value, (self.w, self.h))
 
     @property
     def w(self):
-        if self._img is None:
-            return 0
-        return self.img.shape[1]
+        if self._img is not None:
+            return self._img.shape[1]
+        if self.imginfo is not None:
+            return self.imginfo[0]
+        return 0
 
     @property
     def h(self):
-        if self._img is None:
-            return 0
-        return self.img.shape[0]
+        if self._img is not None:
+            return self._img.shape[0]
+        if self.imginfo is not None:
+            return self.imginfo[1]
+        return 0
 
 
     def get_frame_name(self, f):
@@ -338,7 +401,7 @@ class Session:
         if suffix is not None:
             p1 = (self.dirpath / subdir / str(f)).with_suffix(suffix)
             p2 = (self.dirpath / subdir / str(f).zfill(8)).with_suffix(suffix)
-            if p1.exists(): return p1
+            if self.resources.exists(p1): return p1
             return p2  # padded is now the default
         else:
             if self.suffix:
@@ -346,7 +409,7 @@ class Session:
 
             jpg = self.det_frame_path(f, subdir, '.jpg')
             png = self.det_frame_path(f, subdir, '.png')
-            if jpg.exists():
+            if self.resources.exists(jpg):
                 return jpg
             else:
                 return png
@@ -359,7 +422,7 @@ class Session:
                 or self.det_suffix(1)
 
         fpath = self.det_frame_path(f)
-        if fpath.exists():
+        if self.resources.exists(fpath):
             return fpath.suffix
         return '.png'
 
@@ -441,6 +504,26 @@ class Session:
 
         return 0
 
+    def set_schedule(self, key, schedule: Schedule):
+        """
+        Store a whole schedule as frame data, so get_frame_data(key) reads it at each frame.
+        """
+        self.data[key] = schedule.values.tolist()
+
+    def get_schedule(self, key) -> Schedule | None:
+        """
+        Returns: The frame data of a key as a Schedule, or None if there is none.
+        """
+        if key not in self.data or not self.data[key]:
+            return None
+        return Schedule(np.array([v if v is not None else np.nan for v in self.data[key]], dtype=np.float64))
+
+    def bake_schedules(self, kwargs) -> dict:
+        """
+        Returns: The kwargs with every Schedule replaced by its value at the current frame.
+        """
+        return {k: v[self.f] if isinstance(v, Schedule) else v for k, v in kwargs.items()}
+
     def add_kwargs(self, ifo: JobInfo, kwargs):
         key = ifo.get_groupclass()
         if key in self.args:
@@ -470,7 +553,6 @@ class Session:
 
         # self._image = None
         self.load_f()
-        self.load_file()
 
         if log:
             logsession(f"({self.name}) seek({self.f})")
@@ -493,6 +575,50 @@ class Session:
     def seek_new(self, log=True):
         self.seek(None, log)
 
+    def resume(self, log=True):
+        """
+        Continue an interrupted render: check the frames written since the last journal commit,
+        delete the truncated ones so they are rendered again, and seek to the next frame to render.
+        The temporary files left by writes which crashed midway are deleted.
+        Without a journal, this is the same as seek_new.
+
+        Returns: The frame numbers which must be redone
+        """
+        n = convert.remove_atomic_temps(self.dirpath)
+        if n:
+            logsession(f"({self.name}) resume: removed {n} temporary files of interrupted writes")
+
+        last = self.journal.last()
+        if last is None:
+            self.seek_new(log)
+            return []
+
+        f, name, size, digest = last
+        redo = []
+        if not self.journal.is_valid(self.dirpath / name, size, digest):
+            redo.append(f)
+
+        # Frames after the last commit were written by a crashed or external process, only keep the complete ones
+        for g in range(f + 1, self.f_last + 1):
+            path = self.det_frame_path(g)
+            if not self.resources.exists(path):
+                continue
+            if self.journal.is_valid(path):
+                self.journal.commit(g, path)
+            else:
+                redo.append(g)
+
+        for g in redo:
+            paths.rm(self.det_frame_path(g))
+
+        if redo:
+            self.load(log=False)
+            logsession(f"({self.name}) resume: redoing truncated frames {redo}")
+            self.seek(min(redo), log)
+        else:
+            self.seek_new(log)
+        return redo
+
     def subsession(self, name) -> "Session":
         if name:
             return Session(self.res(name))
@@ -509,19 +635,23 @@ class Session:
 
         if isinstance(ext, (list, tuple)):
             # Try each extension until we find one that exists
-            for e in ext:
-                p = self.res(subpath, ext=e)
-                if p.exists():
-                    return p
-            return None
+            if subpath.suffix == '':
+                exts = ['.' + e.lstrip('.') for e in ext]
+                for dirpath in (self.dirpath, self.dirpath.parent):
+                    ret = self.resources.find(dirpath / subpath.parent, subpath.name, exts)
+                    if ret is not None:
+                        return ret
+                return None
+            ret = self.res(subpath)
+            return ret if self.resources.exists(ret) else None
 
         if subpath.suffix == '' and ext:
-            subpath = subpath.with_suffix('.' + ext)
+            subpath = subpath.with_suffix('.' + ext.lstrip('.'))
 
         ret = self.dirpath / subpath
-        if not ret.exists():
+        if not self.resources.exists(ret):
             ret2 = self.dirpath.parent / subpath
-            if ret2.exists():
+            if self.resources.exists(ret2):
                 return ret2
         return ret
 
@@ -534,7 +664,7 @@ class Session:
             return convert.load_cv2(subpath)
 
         p = self.res(subpath, ext=ext or ('jpg', 'png'))
-        if p.exists():
+        if p is not None and self.resources.exists(p):
             im = convert.load_cv2(p)
             if im is not None:
                 if mode == 'fit':
@@ -552,6 +682,8 @@ class Session:
         resid='video:3' # Get frame 3 from video.mp4
         resid='video' # Get the current session frame from video.mp4
         resid=3 # Get frame 3 from the current session
+
+        loop: How to map frames outside the sequence, True or 'loop', 'pingpong', 'clamp' (see FrameRange)
         """
         # If the resid is a number, assume it is a frame number
         if isinstance(resid, int):
@@ -578,15 +710,16 @@ class Session:
 
         # Iterate dir and find the matching file, regardless of the extension
         framedir = self.res(stem / subdir)
-        if not framedir.is_dir():
+        if not self.resources.is_dir(framedir):
             self.extract_frames(stem)
 
-        l = list(framedir.iterdir())
-        if loop:
-            frame = frame % len(l)
+        frames = self.res_frame_range(stem, subdir)
+        if frames is None:
+            return None
 
-        framestr = str(frame)
-        return self.res(stem / f"{framestr.zfill(paths.leadnum_zpad)}.jpg")
+        frame = frames.map(frame, loop)
+        suffix = '.' + ext.lstrip('.') if ext else frames.suffix
+        return framedir / f"{str(frame).zfill(paths.leadnum_zpad)}{suffix}"
         # for file in l:
         #     if file.stem.lstrip('0') == framestr:
         #         if ext is None or file.suffix.lstrip('.') == ext.lstrip('.'):
@@ -594,14 +727,21 @@ class Session:
         #
         # return None
 
+    def res_frame_range(self, name, subdir='') -> FrameRange | None:
+        """
+        Get the frame range of a sequence resource (e.g. extracted init frames), cached until the directory changes.
+        """
+        return self.resources.frame_range(self.res(Path(name) / subdir))
+
     def res_frame_cv2(self, resid, framenum=None, subdir='', ext=None, loop=False):
         frame_path = self.res_frame(resid, framenum, subdir, ext, loop)
-        if frame_path is None or not frame_path.exists():
+        if frame_path is None or not self.resources.is_file(frame_path):
             return np.zeros((self.h, self.w, 3), dtype=np.uint8)
 
         # resize to fit
+        import cv2
         ret = cv2.imread(str(frame_path))
-        if ret is not None and self.w and self.h:
+        if ret is not None and self.w and self.h and ret.shape[:2] != (self.h, self.w):
             ret = cv2.resize(ret, (self.w, self.h))
 
         return ret
@@ -610,7 +750,7 @@ class Session:
 
 
     def res_framepil(self, name, subdir='', ext=None, loop=False, ctxsize=False):
-        ret = load_pil(self.res_frame(name, subdir, ext, loop))
+        ret = load_pil(self.res_frame(name, None, subdir, ext, loop))
         if ctxsize:
             ret = ret.resize((self.w, self.h))
 
@@ -622,25 +762,61 @@ class Session:
         """
         def _res_music(name, optional):
             name = name or 'music'
-            if self.exists:
-                file = self.res(f"{name}.mp3")
-                if not file.exists(): file = self.res(f"{name}.ogg")
-                if not file.exists(): file = self.res(f"{name}.wav")
-                if not file.exists(): file = self.res(f"{name}.flac")
-                if not file.exists() and not optional: raise FileNotFoundError("Could not find music file in session directory")
-                return file
+            file = self.res(name, ext=['mp3', 'ogg', 'wav', 'flac'])
+            if file is None:
+                if not optional: raise FileNotFoundError("Could not find music file in session directory")
+                file = self.res(f"{name}.flac")
+            return file
 
         if name:
             return _res_music(name, optional)
         else:
             v = _res_music('music', True)
-            if not v.exists():
+            if not self.resources.exists(v):
                 v2 = _res_music('init', True)
-                if v2.exists(): return v2
+                if self.resources.exists(v2): return v2
             if not optional:
                 raise FileNotFoundError("Could not find music file in session directory")
             return v
 
+    @property
+    def audio(self) -> AudioFeatures | None:
+        """
+        The audio analysis of the session's music (see res_music), or None if there is no music.
+        """
+        music = self.res_music(optional=True)
+        if music is None or not self.resources.exists(music):
+            return None
+        if self._audio is None or self._audio.path != music:
+            self._audio = AudioFeatures(music)
+        return self._audio
+
+    def get_audio_data(self, key, clamp=True):
+        """
+        Get an audio feature at the current frame, like get_frame_data. (rms, onset, low, mid, high)
+        Returns: The value in [0, 1], or 0 if there is no music.
+        """
+        audio = self.audio
+        if audio is None:
+            return 0
+
+        values = audio.features(self.fps)[key]
+        f = self.f - 1
+        if f >= len(values):
+            if not clamp:
+                return 0
+            f = len(values) - 1
+        return float(values[max(f, 0)])
+
+    def get_audio_schedule(self, key) -> Schedule | None:
+        """
+        Returns: An audio feature for every frame as a Schedule, or None if there is no music.
+        """
+        audio = self.audio
+        if audio is None:
+            return None
+        return Schedule(audio.features(self.fps)[key])
+
     def res_script(self, name='script', touch=False):
         """
         Get the script resource for this session, or specify by name and auto-detect extension.
@@ -666,6 +842,7 @@ class Session:
 
         """
         self.make_zpad()
+        self.journal.reset()
 
         files = list(self.dirpath.iterdir())
         files.sort()
@@ -730,14 +907,14 @@ class Session:
     def extract_music(self, src='init', overwrite=False):
         input = self.res(src, ext="mp4")
         output = self.res(f"{src}.wav")
-        cmd = f'ffmpeg -i {input} -acodec pcm_s16le -ac 1 -ar 44100 {output}'
         if output.exists():
             if not overwrite:
                 print(f"Music extraction already exists for {input.name}, skipping ...")
-                return
-            paths.rm(input)
+                return output
+            paths.rm(output)
 
-        os.system(cmd)
+        subprocess.run(['ffmpeg', '-v', 'error', '-i', input.as_posix(), '-acodec', 'pcm_s16le', '-ac', '1', '-ar', '44100', output.as_posix()])
+        return output
 
     def extract_frames(self, src, nth_frame=1, frames: tuple | None = None, w=None, h=None, overwrite=False) -> Path | str | None:
         src = self.res(src, ext='mp4')
@@ -763,10 +940,11 @@ class Session:
 
             paths.rmclean(dst)
 
-            try:
-                subprocess.run(['ffmpeg', '-i', f'{src}', '-vf', f'{vf}', '-q:v', '2', '-loglevel', 'error', '-stats', f'{dst}/%0{paths.leadnum_zpad}d.jpg'], stdout=subprocess.PIPE).stdout.decode('utf-8')
-            except:
-                subprocess.run(['ffmpeg.exe', '-i', f'{src}', '-vf', f'{vf}', '-q:v', '2', '-loglevel', 'error', '-stats', f'{dst}/%0{paths.leadnum_zpad}d.jpg'], stdout=subprocess.PIPE).stdout.decode('utf-8')
+            with metrics.extract_seconds.time():
+                try:
+                    subprocess.run(['ffmpeg', '-i', f'{src}', '-vf', f'{vf}', '-q:v', '2', '-loglevel', 'error', '-stats', f'{dst}/%0{paths.leadnum_zpad}d.jpg'], stdout=subprocess.PIPE).stdout.decode('utf-8')
+                except:
+                    subprocess.run(['ffmpeg.exe', '-i', f'{src}', '-vf', f'{vf}', '-q:v', '2', '-loglevel', 'error', '-stats', f'{dst}/%0{paths.leadnum_zpad}d.jpg'], stdout=subprocess.PIPE).stdout.decode('utf-8')
 
             return dst
         else:
@@ -801,13 +979,25 @@ class Session:
         # ----------------------------------------
         frameargs1 = ['-start_number', str(max(skip, self.f_first + skip))]
         frameargs2 = []
+        listfile = None
         lo = 0
         hi = 0
         if frames is not None:
-            lo, hi, name = self.parse_frames(frames, name)
-            print(f'Frame range: {lo} : {hi}')
-            frameargs1 = ['-start_number', str(lo)]
-            frameargs2 = ['-frames:v', str(hi - lo + 1)]
+            fs = self.frameset(frames)
+            lo, hi, name = fs.lo or 0, fs.hi or 0, fs.name(name)
+            print(f'Frame range: {fs.ranges()}')
+            if fs.is_contiguous:
+                frameargs1 = ['-start_number', str(lo)]
+                frameargs2 = ['-frames:v', str(len(fs))]
+            else:
+                # Disjoint ranges, list the frames for the concat demuxer
+                # Kept out of the session directory, it's removed once ffmpeg is done
+                import tempfile
+                with tempfile.NamedTemporaryFile('w', prefix=f'{self.name}_{name}_', suffix='.txt', dir=paths.tmp, delete=False) as fp:
+                    listfile = Path(fp.name)
+                    for f in fs:
+                        fp.write(f"file '{self.det_frame_path(f).as_posix()}'\nduration {1 / fps}\n")
+                    fp.write(f"file '{self.det_frame_path(fs.hi).as_posix()}'\n")
 
         # Music
         # ----------------------------------------
@@ -845,16 +1035,28 @@ class Session:
         # ----------------------------------------
         out = self.dirpath / f'{name}.mp4'
         pattern = self.dirpath / pattern_with_zeroes
-        args = ['ffmpeg', '-y', *musicargs, '-r', str(fps), *frameargs1, '-i', pattern.as_posix(), *frameargs2, '-vf', vf, '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', *bv, *ba, out.as_posix()]
+        if listfile is None:
+            inputargs = ['-r', str(fps), *frameargs1, '-i', pattern.as_posix(), *frameargs2]
+        else:
+            inputargs = ['-f', 'concat', '-safe', '0', '-i', listfile.as_posix(), '-r', str(fps)]
+        args = ['ffmpeg', '-y', *musicargs, *inputargs, '-vf', vf, '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', *bv, *ba, out.as_posix()]
 
         print('')
         print(' '.join(args))
 
         # Don't print output to console
-        if bg:
-            subprocess.Popen(args)
-        else:
-            subprocess.run(args)
+        try:
+            if bg:
+                proc = subprocess.Popen(args)
+                if listfile is not None:
+                    threading.Thread(target=_wait_unlink, args=(proc, listfile), daemon=True).start()
+                    listfile = None
+            else:
+                with metrics.video_seconds.time():
+                    subprocess.run(args)
+        finally:
+            if listfile is not None:
+                listfile.unlink(missing_ok=True)
 
         return out
 
@@ -872,18 +1074,12 @@ class Session:
             self.processing_thread.join()
 
     def _make_archive(self, zipfile, frames, archive_type):
+        fs = self.frameset(frames)
         for f in self.dirpath.glob(f'*{self.suffix}'):
             if self.cancel_processing:
                 break
             try:
-                int(f.stem)
-                ok = False
-                if frames is None:
-                    ok = True
-                else:
-                    lo, hi, n = self.parse_frames(frames, '')
-                    ok = lo <= int(f.stem) <= hi
-                if ok:
+                if int(f.stem) in fs:
                     code = -1
                     if archive_type == 'zip':
                         code = os.system(f"zip -uj {zipfile} {f}  -1")
@@ -898,6 +1094,7 @@ class Session:
     def make_rife_ncnn_vulkan(self, frames=None, name=None, scale=None, fps=None):
         """
         This invokes the rife-ncnn-vulkan executable to interpolate frames in the current session folder.
+        A non-contiguous selection is interpolated as one continuous clip, its output is numbered from 1.
         Linux only.
         """
 
@@ -909,11 +1106,13 @@ class Session:
         else:
             RESOLUTION = 2
 
-        lo, hi, name = self.parse_frames(frames, name or 'rife')
+        fs = self.frameset(frames)
+        lo, hi, name = fs.lo or 0, fs.hi or 0, fs.name(name or 'rife')
         ipath = self.dirpath
         dst = self.dirpath / name
 
-        n_frames = int((hi - lo) * RESOLUTION)
+        # rife sees the selected frames as one dense sequence
+        n_frames = int((len(fs) - 1) * RESOLUTION)
 
         print(f"make_rife({ipath}, dst={dst}, lo={lo}, hi={hi})")
 
@@ -923,7 +1122,7 @@ class Session:
         # start_num = len(list(dst.iterdir()))
 
         dst = paths.rmclean(dst)
-        src = self.copy_frames('rife_src', frames, ipath)
+        src = self.copy_frames('rife_src', fs, ipath, dense=True)
         # src = ipath / 'rife_src'
 
         # proc = shlexproc(f'rife-ncnn-vulkan -i {src.as_posix()} -o {dst.as_posix()}')
@@ -931,48 +1130,176 @@ class Session:
 
         paths.file_tqdm(dst,
                         start=0,
-                        target=(hi - lo) * RESOLUTION,
+                        target=n_frames,
                         process=proc,
                         desc=f"Running rife ...")
         paths.rmtree(src)
-        paths.remap(dst, lambda num: num + lo * RESOLUTION - 1)
+        if fs.is_contiguous:
+            paths.remap(dst, lambda num: num + lo * RESOLUTION - 1)
 
         return dst
 
-    def copy_frames(self, name, frames=None, src=None):
-        name = name
-        lo, hi, name = self.parse_frames(frames, name)
+    def copy_frames(self, name, frames=None, src=None, dense=False):
+        """
+        Copy a selection of frames to a resource directory, skipped if it already holds the selection.
+        Args:
+            name: Name of the directory, suffixed with the selection
+            frames: A frame selection (see FrameSet)
+            src: The directory to copy from, defaults to the session's
+            dense: Number the copies 1..n in frame order instead of keeping the frame numbers,
+                   for tools which expect a sequence without gaps.
+        """
+        src = Path(src or self.dirpath)
+        fs = self.frameset(frames, dirpath=src)
+        lo, hi, name = fs.lo or 0, fs.hi or 0, fs.name(name)
 
-        src = src or self.dirpath
         dst = self.res(name)
 
         if dst.exists():
             num_files = len(list(dst.iterdir()))
-            if num_files == hi - lo:
+            if num_files == len(fs):
                 return dst
 
         paths.rmclean(dst)
 
-        lead = hi - lo
+        from tqdm import tqdm
+        lead = len(fs)
         tq = tqdm(total=lead)
         tq.set_description(f"Copying frames to {dst.relative_to(self.dirpath)} ...")
-        lz = max(len(str(lo)), len(str(hi)))
-        for f in src.iterdir():
-            if f.is_file():
-                try:
-                    leadnum = int(f.stem)
-                except:
-                    leadnum = -1
-
-                if lo <= leadnum <= hi:
-                    shutil.copy(f, dst / f"{leadnum:0{lz}d}{self.suffix}")
-                    tq.update(1)
+        lz = len(str(lead)) if dense else max(len(str(lo)), len(str(hi)))
+        files = {}
+        for filename in self.resources.listdir(src):
+            stem, suffix = os.path.splitext(filename)
+            if stem.isdigit():
+                files[int(stem)] = filename
+
+        for i, f in enumerate(fs, 1):
+            filename = files.get(f)
+            if filename is not None:
+                shutil.copy(src / filename, dst / f"{i if dense else f:0{lz}d}{self.suffix}")
+                tq.update(1)
         # Finish the tq
         tq.update(lead - tq.n)
         tq.close()
 
         return dst
 
+    def map_frames(self, fn, frames=None, workers=None, backend='thread', out=None, fg=True):
+        """
+        Apply fn to every frame in parallel and write the outputs back in frame order.
+        When writing to another session, frames which already have an output are skipped,
+        so an interrupted map resumes where it left off.
+
+        Args:
+            fn: A function taking a frame (h,w,c) and returning the processed frame, or None to skip.
+                Must be picklable (module-level function) for the 'process' backend.
+            frames: A frame selection like '1:100' or '1:100,200:300' (see FrameSet), defaults to the whole session.
+            workers: Number of workers, defaults to the cpu count.
+            backend: 'thread' or 'process'
+            out: A subsession name or a Session to write to, defaults to this session (in-place)
+            fg: Run now, otherwise queue it on the scheduler at batch priority and return the job.
+
+        Returns: The output session
+        """
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        if not fg:
+            return get_scheduler().submit(lambda: self.map_frames(fn, frames, workers, backend, out),
+                                          'map_frames',
+                                          session=self,
+                                          priority=self.get_job_priority(batch=True),
+                                          timeout=self.job_timeout)
+
+        if backend == 'thread':
+            executor_type = ThreadPoolExecutor
+        elif backend == 'process':
+            executor_type = ProcessPoolExecutor
+        else:
+            raise ValueError(f"Unknown map_frames backend: {backend}")
+
+        dst = out if isinstance(out, Session) else self.subsession(out)
+        inplace = dst.dirpath == self.dirpath
+        workers = workers or os.cpu_count() or 1
+
+        # Gather the work, skipping finished outputs
+        fs = self.frameset(frames)
+        lo, hi = fs.lo, fs.hi
+        todo = []
+        skipped = 0
+        for f in fs:
+            src = self.det_frame_path(f)
+            dstpath = dst.det_frame_path(f, suffix='.png')
+            if not self.resources.exists(src):
+                continue
+            if not inplace and dstpath.exists():
+                skipped += 1
+                continue
+            todo.append((f, src, dstpath))
+
+        logsession(f"map_frames({lo}:{hi}, workers={workers}, backend={backend}) -> {dst.nice_path} ({len(todo)} frames, {skipped} done)")
+
+        # Stream frames to the workers with a bounded window,
+        # results are written in frame order as the window head completes.
+        # The process workers return their outputs through shared memory,
+        # one slot per frame in the window so a worker never waits on a slot.
+        ring = None
+        executor_kwargs = dict(max_workers=workers)
+        if backend == 'process' and self.w and self.h:
+            ring = FrameRing((self.h, self.w, 3), slots=workers * 2)
+            executor_kwargs.update(initializer=_map_frame_init, initargs=(ring,))
+
+        try:
+            import userconf
+            from tqdm import tqdm
+            start = time.perf_counter()
+            n = 0
+            tq = tqdm(total=len(todo))
+            tq.set_description(f"Mapping frames to {dst.name} ...")
+            with profiling(self.name, getattr(userconf, 'sampling_profiler', False)), executor_type(**executor_kwargs) as executor:
+                pending = deque()
+
+                def write_next():
+                    nonlocal n
+                    f, src, dstpath, future = pending.popleft()
+                    img = future.result()
+                    if isinstance(img, int):
+                        save_png(ring.view(img), dstpath)
+                        ring.release(img)
+                        n += 1
+                    elif img is not None:
+                        save_png(img, dstpath)
+                        n += 1
+                    if inplace and img is not None and src != dstpath:
+                        # The output replaces the frame, don't keep both (e.g. a .jpg beside its new .png)
+                        src.unlink(missing_ok=True)
+                    tq.update(1)
+
+                try:
+                    for f, src, dstpath in todo:
+                        pending.append((f, src, dstpath, executor.submit(_map_frame, fn, src)))
+                        if len(pending) >= workers * 2:
+                            write_next()
+                    while pending:
+                        write_next()
+                except BaseException:
+                    for f, src, dstpath, future in pending:
+                        future.cancel()
+                    raise
+                finally:
+                    tq.close()
+        finally:
+            # Always free the shared memory, even on errors or ctrl-c
+            if ring is not None:
+                ring.close()
+
+        elapsed = time.perf_counter() - start
+        fps = n / elapsed if elapsed > 0 else 0
+        logsession(f"map_frames: wrote {n} frames in {elapsed:.2f}s ({fps:.2f} fps)")
+
+        dst.load(log=False)
+        return dst
+
     def make_zpad(self, zeroes=None):
         """
         Pad the frame numbers with 8 zeroes
@@ -980,6 +1307,7 @@ class Session:
         if zeroes is None:
             zeroes = paths.leadnum_zpad
 
+        self.journal.reset()
         for f in self.dirpath.iterdir():
             if f.is_file():
                 try:
@@ -993,6 +1321,7 @@ class Session:
         """
         Remove leading zeroes from frame numbers
         """
+        self.journal.reset()
         for f in self.dirpath.iterdir():
             if f.is_file():
                 try:
@@ -1003,16 +1332,32 @@ class Session:
                     pass
 
     def parse_frames(self, frames, name='none'):
-        lo, hi, name = parse_frames(frames, name=name)
-
-        if lo is None: lo = self.f_first
-        if hi is None: hi = self.f_last
+        """
+        Returns: (lo, hi, name) of a frame selection, the open ends default to the session's frames.
+        """
+        fs = self.frameset(frames, existing=False)
+        lo = fs.lo if fs.lo is not None else self.f_first
+        hi = fs.hi if fs.hi is not None else self.f_last
+        return lo, hi, fs.name(name)
 
-        # lead = get_max_leadnum(input)
-        # lo = lo or 0
-        # hi = hi or lead
-        #
-        return lo, hi, name
+    def frameset(self, frames=None, existing=True, dirpath=None) -> FrameSet:
+        """
+        Compile a frame selection against this session, see FrameSet for the spec.
+        Args:
+            frames: A spec like '1:100,200:300', a FrameSet, a (lo, hi) tuple, or None for every frame.
+            existing: Only keep the frames which exist on disk, so the selection never extends past the sequence.
+            dirpath: The directory of the frames for existing, defaults to the session's.
+        """
+        present = None
+        if existing:
+            fr = self.resources.frame_range(dirpath or self.dirpath)
+            if fr is None or fr.count == 0:
+                present = ()
+            elif fr.has_gaps:
+                present = fr.frames
+            else:
+                present = range(fr.first, fr.last + 1)
+        return FrameSet.parse(frames).bind(self.f_first, self.f_last, present)
 
 
     def framerange(self):
@@ -1024,11 +1369,133 @@ class Session:
         else:
             yield self.f_first, self.f_last
 
+    def run_batch(self, jquery, frames=None, batch_size=8, save=True, fg=True, **kwargs):
+        """
+        Run a job over a range of frames, batch_size frames per call.
+        The per-frame args are baked at each frame (so callables are evaluated per frame)
+        and the input frames are stacked into one array when they share a shape, otherwise passed as a list.
+
+        The job must have a batch variant registered on its JobInfo: batch_func(args_list, imgs) -> outputs
+        Each output is scattered back to its frame:
+            - ndarray: the frame image
+            - dict: per-frame data, with an optional 'img' entry for the frame image
+            - None: nothing
+
+        Jobs without a batch variant fall back to running frame by frame.
+
+        Args:
+            jquery: The job to run
+            frames: A frame selection like '1:100' or '::2' (see FrameSet), defaults to the whole session.
+            batch_size: Number of frames per call
+            save: Save the frame images as they are scattered back.
+            fg: Run now, otherwise queue it on the scheduler at batch priority and return the job.
+            **kwargs: The job arguments
+        """
+        from src_core import plugins
+        if self.disable_jobs:
+            return
+
+        ifo = plugins.get_job(jquery)
+        if ifo is None:
+            logsession_err(f"Job {jquery} not found!")
+            return
+
+        if not fg:
+            return get_scheduler().submit(lambda: self.run_batch(jquery, frames, batch_size, save, **kwargs),
+                                          f'{ifo.jid}.batch',
+                                          session=self,
+                                          priority=self.get_job_priority(batch=True),
+                                          timeout=self.job_timeout)
+
+        fs = list(self.frameset(frames, existing=False))
+        if not ifo.is_batchable:
+            logsession_err(f"Job {jquery} has no batch variant, running frame by frame ...")
+            for f in fs:
+                self.seek(f, log=False)
+                self._scatter(self.run(jquery, **kwargs), save)
+            self.save_data()
+            return
+
+        kwargs = {**self.get_kwargs(ifo), **kwargs}
+        self.add_kwargs(ifo, plugins.get_args(jquery, kwargs, True))
+
+        import userconf
+        with profiling(self.name, getattr(userconf, 'sampling_profiler', False)):
+            for start in range(0, len(fs), batch_size):
+                batch = fs[start:start + batch_size]
+
+                # Gather
+                args = []
+                imgs = []
+                for f in batch:
+                    self.seek(f, log=False)
+                    a = ifo.new_args(self.bake_schedules(kwargs))
+                    a.session = self
+                    args.append(a)
+                    imgs.append(self.img)
+
+                if all(isinstance(im, np.ndarray) for im in imgs) and len({im.shape for im in imgs}) == 1:
+                    imgs = np.stack(imgs)
+
+                # Run
+                with trace(f"run_batch({ifo.jid}, {batch[0]}:{batch[-1]})"):
+                    rets = ifo.batch_func(args, imgs)
+
+                if rets is None:
+                    continue
+                if len(rets) != len(batch):
+                    logsession_err(f"Batch job {ifo.jid} returned {len(rets)} outputs for {len(batch)} frames!")
+
+                # Scatter
+                for f, ret in zip(batch, rets):
+                    self.seek(f, log=False)
+                    self._scatter(ret, save)
+
+                logsession(f"({self.name}) run_batch({ifo.jid}) {batch[0]}:{batch[-1]}")
+        self.save_data()
+
+    def _scatter(self, ret, save):
+        """
+        Apply a job output to the current frame.
+        """
+        if isinstance(ret, dict):
+            for k, v in ret.items():
+                if k == 'img':
+                    self.img = v
+                else:
+                    self.set_frame_data(k, v)
+            if 'img' in ret and save:
+                self.save()
+        elif ret is not None:
+            self.img = ret
+            if save:
+                self.save()
+
     def run0(self, jquery, fg=True, **kwargs):
         if self._image is None:
             self.run(jquery, fg=fg, **kwargs)
             self.save()
 
+    def input_nbytes(self) -> int | None:
+        """
+        Returns: The size in bytes of the current frame as a job input, from the header if it wasn't decoded yet.
+        """
+        if self._img is not None:
+            return getattr(self._img, 'nbytes', None)
+        if self.imginfo is not None:
+            w, h, channels, bitdepth = self.imginfo
+            return w * h * channels * max(bitdepth // 8, 1)
+        return None
+
+    def get_job_priority(self, batch=False):
+        """
+        Returns: The scheduling priority for a background job, job_priority if set,
+                 otherwise interactive for single jobs and batch for bulk work over frames.
+        """
+        if self.job_priority is not None:
+            return self.job_priority
+        return batch_priority if batch else interactive_priority
+
     def run(self, jquery, fg=True, **kwargs):
         """
         Run a job in the context of a session.
@@ -1038,7 +1505,7 @@ class Session:
         if self.disable_jobs:
             return
 
-        with cputrace('Session.run', jargs.args.profile_session_run):
+        with cputrace('Session.run', jargs.args.profile_session_run, session=self.name):
             ifo = plugins.get_job(jquery)
             if ifo is None:
                 logsession_err(f"Job {jquery} not found!")
@@ -1049,7 +1516,7 @@ class Session:
                 self.set(ret)
 
             # Apply memorized self kwargs
-            j = plugins.new_job(jquery, **{**self.get_kwargs(ifo), **kwargs})
+            j = plugins.new_job(jquery, **self.bake_schedules({**self.get_kwargs(ifo), **kwargs}))
             j.session = self
             j.on_done = on_done
 
@@ -1073,26 +1540,93 @@ class Session:
 
         if fg:
             # logcore(f"{chalk.blue(j.jid)}(...)")
-            with cputrace('Session.run', jargs.args.profile_run_job):
-                ret = jobs.run(j)
+            # Deterministic jobs can be answered from the cache
+            cache = get_jobcache() if self.cache_jobs and ifo.deterministic else None
+            hit = False
+            if cache is not None:
+                try:
+                    cache_key = cache.key(ifo.jid, j.args, self.img)
+                    hit, ret = cache.get(cache_key)
+                except TypeError as e:
+                    logsession_err(f"Not caching {ifo.jid}: {e}")
+                    cache = None
+
+            if not hit:
+                in_bytes = self.input_nbytes()  # Before the job replaces the image
+                memmon = get_memmon()
+                memmon.monitor()
+                j.timestamp_run = time.time()
+                start = time.perf_counter()
+                cpu = time.thread_time()  # Same measure as the scheduler workers, the job runs on this thread
+
+                ret = None
+                try:
+                    with cputrace(f'run_{ifo.jid}', jargs.args.profile_run_job, session=self.name), trace(f"run({ifo.jid})"):
+                        ret = jobs.run(j)
+                finally:
+                    # Also stop the monitor and record failed jobs
+                    mem = memmon.stop()
+                    elapsed = time.perf_counter() - start
+                    metrics.jobs_run.labels(jid=ifo.jid).inc()
+                    metrics.job_seconds.labels(jid=ifo.jid).observe(elapsed)
+                    get_jobstats().record(ifo.jid,
+                                          wait=j.timestamp_run - j.timestamp_post,
+                                          run=elapsed,
+                                          cpu=time.thread_time() - cpu,
+                                          peak_mem=mem.get('max_rss') or mem.get('active_peak'),
+                                          in_bytes=in_bytes,
+                                          out_bytes=getattr(ret, 'nbytes', None))
+
+                if cache is not None and ret is not None:
+                    try:
+                        cache.put(cache_key, ret)
+                    except Exception as e:
+                        logsession_err(f"Not caching {ifo.jid}: {type(e).__name__}: {e}")
 
             self.jobs.remove(j)
 
             if userconf.print_frames:
-                jargs = j.args
-                jargs_str = {k: v for k, v in jargs.__dict__.items() if isinstance(v, (int, float, str))}
-                jargs_str = ' '.join([f'{chalk.green(k)}={chalk.white(printlib.str(v))}' for k, v in jargs_str.items()])
-
-                if isinstance(ret, np.ndarray):
-                    logsession(f"{chalk.blue(j.jid)}({jargs_str}) -> {chalk.grey(ret.shape)}")
-                else:
-                    logsession(f"{chalk.blue(j.jid)}({jargs_str}) -> {chalk.grey(printlib.str(ret))}")
+                def fmt():
+                    jargs_str = {k: v for k, v in j.args.__dict__.items() if isinstance(v, (int, float, str))}
+                    jargs_str = ' '.join([f'{chalk.green(k)}={chalk.white(printlib.value_to_print_str(v))}' for k, v in jargs_str.items()])
+                    if isinstance(ret, np.ndarray):
+                        return f"{chalk.blue(j.jid)}({jargs_str}) -> {chalk.grey(ret.shape)}"
+                    return f"{chalk.blue(j.jid)}({jargs_str}) -> {chalk.grey(printlib.value_to_print_str(ret))}"
+
+                logsession(fmt)
             return ret
         else:
-            return jobs.enqueue(j)
+            return get_scheduler().enqueue(j, priority=self.get_job_priority(), timeout=self.job_timeout)
             # proxy.emit("start_job", plugins.new_args())
 
 
+def _wait_unlink(proc, path):
+    """
+    Delete a file once a background process is done with it.
+    """
+    proc.wait()
+    path.unlink(missing_ok=True)
+
+
+_map_ring = None
+
+
+def _map_frame_init(ring):
+    global _map_ring
+    _map_ring = ring
+
+
+def _map_frame(fn, src):
+    """
+    Worker for Session.map_frames, the frame is decoded in the worker to avoid shipping it over.
+    In a process worker with a ring, outputs are returned as a slot handle instead of a pickled array.
+    """
+    ret = fn(convert.load_cv2(src))
+    if _map_ring is not None and _map_ring.fits(ret):
+        return _map_ring.write(ret)
+    return ret
+
+
 def concat(s1, s2):
     if s1:
         s1 += ','
@@ -0,0 +1,256 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from . import paths
+
+columns = ['name', 'path', 'f_first', 'f_last', 'w', 'h', 'fps', 'size', 'mtime']
+schema_version = 1
+
+
+class SessionCatalog:
+    """
+    A persistent index of the sessions (SQLite), so they can be listed and searched
+    without scanning the sessions folder or constructing a Session for each one.
+
+    Only the sessions directly under paths.sessions are cataloged, keyed by their path.
+    (subsessions and sessions at other paths are ignored)
+    Rows are updated incrementally by Session.load and Session.save, with the directory's mtime.
+    Per-frame updates are buffered in memory and written at most every flush_interval seconds,
+    or before any query.
+    Queries first rescan the sessions folder if it changed since the last scan, to pick up
+    the sessions created, copied or deleted outside of Session. (CLI, file manager, another machine)
+
+    catalog = get_catalog()
+    catalog.list(search='banner', limit=20)  # Most recent first
+    catalog.recent()  # -> dict(name=..., path=..., w=..., mtime=...)
+    """
+
+    def __init__(self, dbpath=None, flush_interval=2):
+        self.dbpath = Path(dbpath or paths.root / 'sessions.db')
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.pending = {}  # path -> row dict, not yet written
+        self.last_flush = time.monotonic()
+        self._db = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.dbpath.as_posix(), check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            if self._db.execute('PRAGMA user_version').fetchone()[0] < schema_version:
+                # Rows used to be keyed by name, re-index from scratch
+                self._db.execute('DROP TABLE IF EXISTS sessions')
+                self._db.execute(f'PRAGMA user_version={schema_version}')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                                path TEXT PRIMARY KEY,
+                                name TEXT NOT NULL,
+                                f_first INTEGER, f_last INTEGER,
+                                w INTEGER, h INTEGER, fps REAL,
+                                size INTEGER, mtime REAL)''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS sessions_mtime ON sessions (mtime)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+            self._db.commit()
+            atexit.register(self.flush)
+        return self._db
+
+    def update(self, session, added_bytes=None):
+        """
+        Record the current state of a session.
+        Args:
+            session: The session, ignored unless it's directly under paths.sessions
+            added_bytes: Size of a newly saved frame, to avoid walking the directory for the size on disk.
+        """
+        path = catalog_path(session.dirpath)
+        if path is None:
+            return
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+
+        with self.lock:
+            row = self.pending.get(path) or self.get(path, flush=False)
+            size = row['size'] if row else None
+            if added_bytes is None or size is None:
+                size = dir_size(path)
+            else:
+                size += added_bytes
+
+            self.pending[path] = dict(name=session.dirpath.name,
+                                      path=path,
+                                      f_first=session.f_first,
+                                      f_last=session.f_last,
+                                      w=session.w or (row and row['w']) or None,
+                                      h=session.h or (row and row['h']) or None,
+                                      fps=session.fps,
+                                      size=size,
+                                      mtime=mtime)
+
+            if time.monotonic() - self.last_flush > self.flush_interval:
+                self.flush()
+
+    def remove(self, dirpath):
+        path = catalog_path(dirpath) or Path(dirpath).as_posix()
+        with self.lock:
+            self.pending.pop(path, None)
+            self.db.execute('DELETE FROM sessions WHERE path = ?', (path,))
+            self.db.commit()
+
+    def flush(self):
+        """
+        Write the pending updates.
+        """
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending:
+                return
+
+            rows = list(self.pending.values())
+            self.pending.clear()
+            self.db.executemany(f"INSERT OR REPLACE INTO sessions ({', '.join(columns)}) "
+                                f"VALUES ({', '.join(':' + c for c in columns)})", rows)
+            self.db.commit()
+
+    def get(self, dirpath, flush=True) -> dict | None:
+        path = Path(dirpath).as_posix()
+        with self.lock:
+            if path in self.pending:
+                return self.pending[path]
+            if flush:
+                self.sync()
+                self.flush()
+            row = self.db.execute('SELECT * FROM sessions WHERE path = ?', (path,)).fetchone()
+            return dict(row) if row else None
+
+    def list(self, search=None, limit=None, offset=0) -> list[dict]:
+        """
+        Returns: The sessions, most recent first, optionally filtered by a substring of the name.
+        """
+        sql = 'SELECT * FROM sessions'
+        params = []
+        if search:
+            sql += " WHERE name LIKE ? ESCAPE '\\'"
+            params.append('%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        sql += ' ORDER BY mtime DESC'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [limit, offset]
+
+        with self.lock:
+            self.sync()
+            self.flush()
+            return [dict(row) for row in self.db.execute(sql, params)]
+
+    def recent(self) -> dict | None:
+        """
+        Returns: The most recently modified session which still exists, or None.
+        """
+        with self.lock:
+            self.sync()
+            self.flush()
+            while True:
+                row = self.db.execute('SELECT * FROM sessions ORDER BY mtime DESC LIMIT 1').fetchone()
+                if row is None:
+                    return None
+                if Path(row['path']).is_dir():
+                    return dict(row)
+                self.remove(row['path'])  # Deleted externally
+
+    def sync(self, force=False):
+        """
+        Rescan the sessions folder if its mtime changed since the last scan.
+        Only the directory stats are read, and the sessions whose directory mtime didn't change keep their row.
+        The resolution of a new session is filled in the next time it's loaded.
+        """
+        paths.ensure_dirs()
+        scanned = os.stat(paths.sessions).st_mtime_ns
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'scanned_mtime'").fetchone()
+            if not force and row is not None and row[0] == scanned:
+                return
+
+            self.flush()
+            known = {row['path']: dict(row) for row in self.db.execute('SELECT * FROM sessions')}
+            rows = []
+            for entry in os.scandir(paths.sessions):
+                if not entry.is_dir():
+                    continue
+
+                path = Path(entry.path).as_posix()
+                mtime = entry.stat().st_mtime
+                old = known.pop(path, None)
+                if old is not None and old['mtime'] == mtime:
+                    continue
+
+                lo, hi = paths.get_leadnum(Path(entry.path))
+                rows.append(dict(name=entry.name,
+                                 path=path,
+                                 f_first=lo or 0,
+                                 f_last=hi or 0,
+                                 w=old and old['w'],
+                                 h=old and old['h'],
+                                 fps=old and old['fps'],
+                                 size=dir_size(entry.path),
+                                 mtime=mtime))
+
+            # What's left was deleted externally
+            self.db.executemany('DELETE FROM sessions WHERE path = ?', [(path,) for path in known])
+            self.db.executemany(f"INSERT OR REPLACE INTO sessions ({', '.join(columns)}) "
+                                f"VALUES ({', '.join(':' + c for c in columns)})", rows)
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scanned_mtime', ?)", (scanned,))
+            self.db.commit()
+
+    def rebuild(self):
+        """
+        Re-index the sessions folder from scratch.
+        """
+        with self.lock:
+            self.pending.clear()
+            self.db.execute('DELETE FROM sessions')
+            self.db.commit()
+            self.sync(force=True)
+
+
+def catalog_path(dirpath) -> str | None:
+    """
+    Returns: The catalog key of a session directory, or None if it isn't directly under paths.sessions.
+    """
+    dirpath = Path(dirpath)
+    if dirpath.parent != paths.sessions and dirpath.resolve().parent != paths.sessions.resolve():
+        return None
+    return (paths.sessions / dirpath.name).as_posix()
+
+
+def dir_size(path) -> int:
+    """
+    Returns: The total size of the files directly in a directory, in bytes.
+    """
+    total = 0
+    try:
+        for entry in os.scandir(path):
+            if entry.is_file():
+                total += entry.stat().st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+_catalog = None
+
+
+def get_catalog() -> SessionCatalog:
+    """
+    Returns: The shared session catalog under paths.root, created on first use.
+    """
+    global _catalog
+    if _catalog is None:
+        _catalog = SessionCatalog()
+    return _catalog
@@ -0,0 +1,137 @@
+"""
+Performance benchmarks for the core classes.
+
+python -m src_core.classes.bench imports  # Cold import cost per module, fails when a module is over its budget
+python -m src_core.classes.bench trace    # Per-call overhead of trace_decorator when tracing is disabled
+"""
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+from . import paths
+
+# Cold import budgets in milliseconds (cumulative, including dependencies)
+import_budgets = {
+    'src_core.classes.paths': 30,
+    'src_core.classes.printlib': 250,
+    'src_core.classes.logs': 250,
+    'src_core.classes.convert': 250,
+    'src_core.classes.MemMon': 30,
+    'src_core.classes.JobInfo': 300,
+    'src_core.classes.Session': 600,
+}
+
+# Max overhead of a disabled trace_decorator, in nanoseconds per call
+trace_overhead_budget = 500
+
+
+def measure_import(module, python=None):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    Returns: (cumulative ms of the module, [(self ms, name)] sorted by self time)
+    Modules already imported by the interpreter at startup measure 0.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([paths.root.as_posix(), env.get('PYTHONPATH', '')])
+    proc = subprocess.run([python or sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=paths.root.as_posix(),
+                          env=env,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Could not import {module}:\n{proc.stderr[-2000:]}")
+
+    cumulative = None
+    entries = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+
+        self_us, cumul_us, name = int(fields[0]), int(fields[1]), fields[2].strip()
+        entries.append((self_us / 1000, name))
+        if name == module:
+            cumulative = cumul_us / 1000
+
+    entries.sort(reverse=True)
+    return cumulative or 0, entries
+
+
+def bench_imports(budgets=None, repeat=3, top=5) -> bool:
+    """
+    Measure the cold import time of each module (best of a few runs) against its budget.
+    Returns: Whether every module is within its budget
+    """
+    budgets = budgets or import_budgets
+    ok = True
+    for module, budget in budgets.items():
+        best = None
+        entries = []
+        for _ in range(repeat):
+            ms, e = measure_import(module)
+            if best is None or ms < best:
+                best, entries = ms, e
+
+        over = best > budget
+        ok = ok and not over
+        print(f"{'FAIL' if over else 'ok':4} {module:40} {best:8.1f}ms / {budget}ms")
+        if over:
+            for self_ms, name in entries[:top]:
+                print(f"       {self_ms:8.1f}ms  {name}")
+
+    return ok
+
+
+def bench_trace(number=1000000, budget=None) -> bool:
+    """
+    Measure the per-call overhead of trace_decorator with tracing disabled, against a plain call.
+    Returns: Whether the overhead is within the budget
+    """
+    import numpy as np
+    from . import printlib
+
+    budget = budget or trace_overhead_budget
+
+    def plain(a, b, c=None):
+        return a
+
+    traced = printlib.trace_decorator(plain)
+    img = np.zeros((512, 512, 3), dtype=np.uint8)
+
+    print_trace, record_trace = printlib.print_trace, printlib.record_trace
+    printlib.print_trace = printlib.record_trace = False
+    try:
+        t_plain = min(timeit.repeat(lambda: plain(img, 1.5, c='x'), number=number, repeat=3))
+        t_traced = min(timeit.repeat(lambda: traced(img, 1.5, c='x'), number=number, repeat=3))
+    finally:
+        printlib.print_trace, printlib.record_trace = print_trace, record_trace
+
+    overhead = (t_traced - t_plain) / number * 1e9
+    ok = overhead <= budget
+    print(f"{'ok' if ok else 'FAIL':4} trace_decorator disabled: {t_traced / number * 1e9:.0f}ns/call, plain: {t_plain / number * 1e9:.0f}ns/call, overhead: {overhead:.0f}ns / {budget}ns")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench', description='Core performance benchmarks')
+    parser.add_argument('what', choices=['imports', 'trace'])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    ok = True
+    if args.what == 'imports':
+        ok = bench_imports(repeat=args.repeat)
+    elif args.what == 'trace':
+        ok = bench_trace()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,186 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
-import cv2
 import numpy as np
-from PIL import Image
 
-from src_core.classes.printlib import trace
-
-
-def pil2cv(img: Image) -> np.ndarray:
+from src_core.classes.printlib import printerr, trace
+
+# cv2 and PIL are imported on first use, they are slow to import.
+
+
+class Frame:
+    """
+    An image array which knows its channel order and where it came from,
+    so conversions happen only when a consumer asks for another order.
+    Channel swaps are views into the same pixels, not copies. (copy them with np.ascontiguousarray if a library needs it)
+
+    frame = Frame.load(path)  # Decoded by cv2, BGR
+    frame.rgb()  # A view, no copy
+    frame.pil()
+    """
+    __slots__ = ('array', 'order', 'path')
+
+    def __init__(self, array: np.ndarray, order='RGB', path=None):
+        """
+        Args:
+            array: (h, w) or (h, w, c) pixels
+            order: Channel order, one of GRAY, RGB, RGBA, BGR, BGRA
+            path: The file the frame was decoded from, if any
+        """
+        self.array = array
+        self.order = order
+        self.path = path
+
+    @staticmethod
+    def load(path) -> "Frame | None":
+        """
+        Decode an image file, or None if it can't be read.
+        """
+        import cv2
+        path = Path(path)
+        arr = cv2.imread(path.as_posix(), cv2.IMREAD_UNCHANGED)
+        if arr is None:
+            return None
+        if arr.ndim == 2:
+            return Frame(arr, 'GRAY', path)
+        return Frame(arr, 'BGRA' if arr.shape[2] == 4 else 'BGR', path)
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def w(self):
+        return self.array.shape[1]
+
+    @property
+    def h(self):
+        return self.array.shape[0]
+
+    def to(self, order) -> np.ndarray:
+        """
+        Returns: The pixels in the given channel order, a view where possible.
+        """
+        arr = self.array
+        if order == self.order:
+            return arr
+
+        if self.order == 'GRAY':
+            arr = np.repeat(arr[..., None], len(order), axis=2)
+            if len(order) == 4:
+                arr[..., 3] = np.iinfo(arr.dtype).max if arr.dtype.kind in 'ui' else 1
+            return arr
+
+        if order == 'GRAY':
+            import cv2
+            src = self.array[..., :3] if self.order in ('RGB', 'RGBA') else self.array[..., 2::-1]
+            return cv2.cvtColor(np.ascontiguousarray(src), cv2.COLOR_RGB2GRAY)
+
+        if self.order[:3] != order[:3]:
+            arr = np.concatenate([arr[..., 2::-1], arr[..., 3:]], axis=2) if arr.shape[2] == 4 and len(order) == 4 else arr[..., 2::-1]
+        elif len(order) == 3:
+            arr = arr[..., :3]
+
+        if len(order) == 4 and arr.shape[2] == 3:
+            alpha = np.full(arr.shape[:2] + (1,), np.iinfo(arr.dtype).max if arr.dtype.kind in 'ui' else 1, dtype=arr.dtype)
+            arr = np.concatenate([arr, alpha], axis=2)
+        return arr
+
+    def rgb(self) -> np.ndarray:
+        return self.to('RGB')
+
+    def bgr(self) -> np.ndarray:
+        return self.to('BGR')
+
+    def pil(self) -> 'Image':
+        from PIL import Image
+        if self.order in ('GRAY', 'RGB', 'RGBA'):
+            return Image.fromarray(self.array)
+        return Image.fromarray(np.ascontiguousarray(self.to('RGBA' if self.order == 'BGRA' else 'RGB')))
+
+    def save_png(self, path):
+        import cv2
+        arr = self.array if self.order in ('GRAY', 'BGR', 'BGRA') else self.to('BGRA' if self.order == 'RGBA' else 'BGR')
+        with atomic_write(path) as tmp:
+            if not cv2.imwrite(tmp.as_posix(), np.ascontiguousarray(arr)):
+                raise IOError(f"Couldn't write {path}")
+
+    def __repr__(self):
+        return f"Frame({self.w}x{self.h}, {self.order}, {self.dtype}, {self.path})"
+
+
+def pil2cv(img: 'Image') -> np.ndarray:
     return np.asarray(img)
 
 
-def cv2pil(img: np.ndarray) -> Image:
+def cv2pil(img: np.ndarray) -> 'Image':
+    from PIL import Image
+    if isinstance(img, Frame):
+        return img.pil()
     return Image.fromarray(img)
 
 
+@contextmanager
+def atomic_write(path):
+    """
+    Write to a hidden temporary file next to path, then rename it over path,
+    so readers and crash recovery never see a half-written file.
+
+    with atomic_write(path) as tmp:
+        im.save(tmp)
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{path.suffix}')
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+
+_atomic_temp_re = re.compile(r'^\..+\.(\d+)\.\d+\.tmp(\.[^.]*)?$')  # .<stem>.<pid>.<tid>.tmp<suffix>
+
+
+def remove_atomic_temps(dirpath) -> int:
+    """
+    Delete the temporary files of atomic_write left in a directory by processes which died mid-write.
+    Returns: The number of files removed
+    """
+    n = 0
+    for tmp in Path(dirpath).glob('.*.tmp*'):
+        m = _atomic_temp_re.match(tmp.name)
+        if m is None:
+            continue
+        if _is_pid_alive(int(m.group(1))):
+            continue  # Still being written
+        try:
+            tmp.unlink()
+            n += 1
+        except OSError:
+            pass
+    return n
+
+
+def _is_pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists, but not ours
+    return True
+
+
 def ensure_extension(path: str | Path, ext):
     path = Path(path)
     if path.suffix != ext:
@@ -23,20 +189,30 @@ def ensure_extension(path: str | Path, ext):
 
 
 def save_png(pil, path, with_async=False):
-    pil = load_pil(pil)
-
+    """
+    Save an image as PNG. Frames and RGB arrays are written by cv2 without going through PIL.
+    """
     if pil is None:
         return
 
-    with trace(f'save_png({Path(path).relative_to(Path.cwd())}, async={with_async}, {pil})'):
-        lpath = ensure_extension(path, '.png')
-        path = Path(path)
+    with trace(f'save_png({Path(path).name}, async={with_async})'):
+        path = ensure_extension(path, '.png')
+
+        if isinstance(pil, np.ndarray):
+            pil = Frame(pil, 'GRAY' if pil.ndim == 2 else 'RGBA' if pil.shape[2] == 4 else 'RGB')
+        if isinstance(pil, Frame):
+            if with_async:
+                save_async(path, pil)
+            else:
+                pil.save_png(path)
+            return
 
+        pil = load_pil(pil)
         if with_async:
             save_async(path, pil)
         else:
-            Path(path).parent.mkdir(parents=True, exist_ok=True)
-            pil.save(path, format="PNG")
+            with atomic_write(path) as tmp:
+                pil.save(tmp, format="PNG")
 
 
 def save_async(path, pil) -> None:
@@ -46,14 +222,16 @@ def save_async(path, pil) -> None:
     # Use threaded lambda to save image
     def write(im) -> None:
         try:
+            if isinstance(im, Frame):
+                im.save_png(path)
+                return
             if isinstance(im, np.ndarray):
                 im = cv2pil(im)
-            Path(path).parent.mkdir(parents=True, exist_ok=True)
-            im.save(path, format='PNG')
-        except:
-            pass
+            with atomic_write(path) as tmp:
+                im.save(tmp, format='PNG')
+        except Exception as e:
+            printerr(f"save_async({path}) failed: {type(e).__name__}: {e}")
 
-    import threading
     t = threading.Thread(target=write, args=(pil,))
     t.start()
 
@@ -106,10 +284,12 @@ def load_json(path, default='required'):
             return default
 
 
-def load_pil(path: Image.Image | Path | str, size=None):
+def load_pil(path: 'Image.Image | Path | str', size=None):
+    from PIL import Image
     ret = None
 
     if isinstance(path, Image.Image): ret = path
+    if isinstance(path, Frame): ret = path.pil()
     if isinstance(path, Path): ret = Image.open(path.as_posix())
     if isinstance(path, str) and Path(path).is_file(): ret = Image.open(path)
     if isinstance(path, str) and path.startswith('#'): ret = Image.new('RGB', size or (1, 1), color=path)
@@ -118,7 +298,8 @@ def load_pil(path: Image.Image | Path | str, size=None):
     if ret is None:
         raise ValueError(f'Unknown type of path: {type(path)}')
 
-    ret = ret.convert('RGB')
+    if ret.mode != 'RGB':
+        ret = ret.convert('RGB')
     if size is not None:
         ret = ret.resize(size, Image.LANCZOS)
 
@@ -127,15 +308,17 @@ def load_pil(path: Image.Image | Path | str, size=None):
 
 def load_pilarr(pil, size=None):
     pil = load_pil(pil, size)
-    pil = pil.convert('RGB')
     return np.array(pil)
 
 def load_cv2(pil, size=None):
+    import cv2
+    from PIL import Image
     ret = None
 
     if isinstance(pil, np.ndarray): ret = pil
+    elif isinstance(pil, Frame): ret = np.ascontiguousarray(pil.to(pil.order.replace('BGR', 'RGB')))
     elif isinstance(pil, Image.Image): ret = pil2cv(pil)
-    elif isinstance(pil, Path): ret = pil2cv(Image.open(pil.as_posix()))
+    elif isinstance(pil, Path): ret = load_cv2(load_frame(pil))
     elif isinstance(pil, str) and Path(pil).is_file(): ret = cv2.imread(pil)
     elif isinstance(pil, str) and pil.startswith('#'):
         rgb = Image.new('RGB', size or (1, 1), color=pil)
@@ -157,7 +340,105 @@ def load_cv2(pil, size=None):
 
     return ret
 
+# region Probing
+_png_channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}  # PNG color type -> channels once decoded
+_jpeg_sof = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_probe_cache = {}  # path -> (mtime_ns, size, result)
+
+
+def probe_image(path: Path | str) -> tuple[int, int, int, int] | None:
+    """
+    Read the dimensions of an image from its header, without decoding the pixels.
+    PNG and JPEG headers are parsed directly, other formats go through PIL's lazy open.
+    Results are cached until the file changes.
+
+    Returns: (w, h, channels, bitdepth), or None if the file doesn't exist or isn't an image.
+    """
+    import os
+
+    path = os.fspath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    cached = _probe_cache.get(path)
+    if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+                w = int.from_bytes(head[16:20], 'big')
+                h = int.from_bytes(head[20:24], 'big')
+                ret = (w, h, _png_channels.get(head[25], 3), head[24])
+            elif head[:2] == b'\xff\xd8':
+                ret = _probe_jpeg(f)
+            else:
+                ret = _probe_pil(path)
+    except Exception:
+        ret = None
+
+    if len(_probe_cache) > 4096:
+        _probe_cache.clear()
+    _probe_cache[path] = (st.st_mtime_ns, st.st_size, ret)
+    return ret
+
+
+def _probe_jpeg(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:  # No payload
+            continue
+
+        lb = f.read(2)
+        if len(lb) < 2:  # Truncated file
+            return None
+        length = int.from_bytes(lb, 'big')
+        if length < 2:  # Corrupt segment, seeking by it would never advance
+            return None
+        if marker[1] in _jpeg_sof:
+            seg = f.read(6)
+            if len(seg) < 6:
+                return None
+            bitdepth = seg[0]
+            h = int.from_bytes(seg[1:3], 'big')
+            w = int.from_bytes(seg[3:5], 'big')
+            return w, h, seg[5], bitdepth
+        f.seek(length - 2, 1)
+
+
+def _probe_pil(path):
+    from PIL import Image
+    with Image.open(path) as im:  # Only reads the header
+        bitdepth = 16 if im.mode.startswith('I;16') else 32 if im.mode in ('I', 'F') else 8
+        return im.width, im.height, len(im.getbands()), bitdepth
+# endregion
+
+
+def load_frame(path) -> Frame:
+    """
+    Decode an image file into a Frame, raises if it can't be read.
+    """
+    ret = Frame.load(path)
+    if ret is None:
+        raise IOError(f"Couldn't read image {path}")
+    return ret
+
+
 def fit(im, width, height, background='black'):
+    import cv2
+    if (width is None or height is None) and isinstance(im, (str, Path)):
+        # Fit to the image's own size
+        info = probe_image(im)
+        if info is not None:
+            width = width or info[0]
+            height = height or info[1]
+
     # Fit image to width and height and center it
     # The background is another cv2 image (h,w,c)
     im = load_cv2(im, (width, height))
@@ -0,0 +1,280 @@
+"""
+An in-process metrics registry (counters, gauges, histograms) exposed in the Prometheus text format,
+either written to a file (for node_exporter's textfile collector) or served on a tiny local HTTP endpoint.
+
+frames_saved = counter('frames_saved_total', 'Frames saved')
+frames_saved.inc()
+with save_seconds.time():
+    ...
+
+metrics.serve(9100)  # http://localhost:9100/metrics
+metrics.write_textfile('/var/lib/node_exporter/discore.prom')
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+prefix = 'discore_'
+default_buckets = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = prefix + name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        self.fn = None
+        self.lock = threading.Lock()
+
+    def labels(self, *values, **kwvalues) -> "_Child":
+        if kwvalues:
+            values = tuple(str(kwvalues[k]) for k in self.labelnames)
+        return _Child(self, tuple(str(v) for v in values))
+
+    def collect(self):
+        """
+        Returns: A list of (suffix, label values, value)
+        """
+        if self.fn is not None:
+            return [('', (), self.fn())]
+        with self.lock:
+            if not self.values and not self.labelnames:
+                return [('', (), 0)]
+            return [('', k, v) for k, v in self.values.items()]
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.doc}',
+                 f'# TYPE {self.name} {self.kind}']
+        for suffix, labelvalues, value, *extra in self.collect():
+            labels = list(zip(self.labelnames, labelvalues))
+            if extra:
+                labels += extra[0]
+            lines.append(f'{self.name}{suffix}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines)
+
+
+class _Child:
+    """
+    A metric bound to label values.
+    """
+
+    def __init__(self, metric, labelvalues):
+        self.metric = metric
+        self.labelvalues = labelvalues
+
+    def __getattr__(self, item):
+        fn = getattr(self.metric, item)
+        return lambda *args, **kwargs: fn(*args, _labels=self.labelvalues, **kwargs)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, _labels=()):
+        with self.lock:
+            self.values[_labels] = self.values.get(_labels, 0) + amount
+
+    def get(self, _labels=()):
+        return self.values.get(_labels, 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, _labels=()):
+        with self.lock:
+            self.values[_labels] = value
+
+    def inc(self, amount=1, _labels=()):
+        with self.lock:
+            self.values[_labels] = self.values.get(_labels, 0) + amount
+
+    def dec(self, amount=1, _labels=()):
+        self.inc(-amount, _labels=_labels)
+
+    def get(self, _labels=()):
+        return self.values.get(_labels, 0)
+
+    def set_function(self, fn):
+        """
+        Compute the value on collection instead, e.g. a queue depth.
+        """
+        self.fn = fn
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labelnames=(), buckets=default_buckets):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, _labels=()):
+        with self.lock:
+            v = self.values.get(_labels)
+            if v is None:
+                v = self.values[_labels] = [[0] * len(self.buckets), 0, 0]  # bucket counts, sum, count
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    v[0][i] += 1
+                    break
+            v[1] += value
+            v[2] += 1
+
+    @contextmanager
+    def time(self, _labels=()):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, _labels=_labels)
+
+    def collect(self):
+        ret = []
+        with self.lock:
+            for labelvalues, (counts, total, n) in self.values.items():
+                cumulative = 0
+                for le, c in zip(self.buckets, counts):
+                    cumulative += c
+                    ret.append(('_bucket', labelvalues, cumulative, [('le', format_value(le))]))
+                ret.append(('_sum', labelvalues, total))
+                ret.append(('_count', labelvalues, n))
+        return ret
+
+
+def _register(cls, name, *args, **kwargs):
+    with _lock:
+        if prefix + name not in _metrics:
+            _metrics[prefix + name] = cls(name, *args, **kwargs)
+        return _metrics[prefix + name]
+
+
+def counter(name, doc, labelnames=()) -> Counter:
+    return _register(Counter, name, doc, labelnames)
+
+
+def gauge(name, doc, labelnames=()) -> Gauge:
+    return _register(Gauge, name, doc, labelnames)
+
+
+def histogram(name, doc, labelnames=(), buckets=default_buckets) -> Histogram:
+    return _register(Histogram, name, doc, labelnames, buckets)
+
+
+def _escape_label(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    s = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+    return '{' + s + '}'
+
+
+def format_value(v):
+    if v is None:
+        return 'NaN'
+    if v == math.inf:
+        return '+Inf'
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
+
+
+def expose() -> str:
+    """
+    Returns: Every metric in the Prometheus text format
+    """
+    with _lock:
+        metrics = list(_metrics.values())
+    return '\n'.join(m.expose() for m in metrics) + '\n'
+
+
+def write_textfile(path):
+    """
+    Write the metrics atomically to a file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w') as f:
+        f.write(expose())
+    os.replace(tmp, path)
+    return path
+
+
+_server = None
+
+
+def serve(port=9100, host='127.0.0.1'):
+    """
+    Serve the metrics on http://host:port/metrics from a daemon thread.
+    """
+    global _server
+    if _server is not None:
+        return _server
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/metrics'):
+                self.send_error(404)
+                return
+
+            body = expose().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+    return _server
+
+
+# region Core metrics
+frames_saved = counter('frames_saved_total', 'Frames saved by Session.save')
+frames_loaded = counter('frames_loaded_total', 'Frames loaded by Session.load_file')
+save_seconds = histogram('save_seconds', 'Session.save latency (encode + write)')
+load_seconds = histogram('load_seconds', 'Session.load_file latency (read + decode)')
+render_fps = gauge('render_fps', 'Frames saved per second, smoothed')
+extract_seconds = histogram('extract_frames_seconds', 'Session.extract_frames duration', buckets=(1, 5, 10, 30, 60, 120, 300, 600, math.inf))
+video_seconds = histogram('make_video_seconds', 'Session.make_video encode duration', buckets=(1, 5, 10, 30, 60, 120, 300, 600, math.inf))
+jobs_run = counter('jobs_total', 'Jobs executed by Session.run', ['jid'])
+job_seconds = histogram('job_seconds', 'Job run time', ['jid'])
+jobcache_hits = counter('jobcache_hits_total', 'Job results served from the job cache')
+jobcache_misses = counter('jobcache_misses_total', 'Deterministic jobs not found in the job cache')
+jobs_queued = gauge('jobs_queued', 'Jobs waiting in the scheduler')
+jobs_running = gauge('jobs_running', 'Jobs running in the scheduler')
+
+_last_save = None
+
+
+def on_frame_saved():
+    """
+    Count a saved frame and update the smoothed fps.
+    """
+    global _last_save
+    frames_saved.inc()
+
+    now = time.perf_counter()
+    if _last_save is not None and now > _last_save:
+        fps = 1 / (now - _last_save)
+        render_fps.set(fps if render_fps.get() == 0 else render_fps.get() * 0.9 + fps * 0.1)
+    _last_save = now
+# endregion
@@ -35,10 +35,22 @@ sessions = root / sessions_name
 
 session_timestamp_format = '%Y-%m-%d_%Hh%M'
 
-plug_res.mkdir(exist_ok=True)
-plug_logs.mkdir(exist_ok=True)
-plug_repos.mkdir(exist_ok=True)
-sessions.mkdir(exist_ok=True)
+_dirs_ensured = False
+
+
+def ensure_dirs():
+    """
+    Create the user directories, on first use rather than on import.
+    """
+    global _dirs_ensured
+    if _dirs_ensured:
+        return
+
+    plug_res.mkdir(exist_ok=True)
+    plug_logs.mkdir(exist_ok=True)
+    plug_repos.mkdir(exist_ok=True)
+    sessions.mkdir(exist_ok=True)
+    _dirs_ensured = True
 
 # These suffixes will be stripped from the plugin IDs for simplicity
 plugin_suffixes = ['_plugin']
@@ -92,8 +104,8 @@ def split_jid(jid, allow_jobonly=False):
 
 
 def is_session(v):
-    v = str(v)
-    return sessions / v in sessions.iterdir()
+    ensure_dirs()
+    return (sessions / str(v)).is_dir()
 
 
 def parse_frames(frames, name='none'):
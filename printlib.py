@@ -1,11 +1,13 @@
+import functools
 import sys
+import threading
 import time
 import traceback
+from collections import deque
 from contextlib import contextmanager
 from time import perf_counter
 
 import numpy as np
-import torch
 
 print_timing = False
 print_trace = False
@@ -14,8 +16,51 @@ print_gputrace = False
 last_time = time.time()
 
 # Set default decimal precision for printing
-torch.set_printoptions(precision=2)
+# torch is heavy to import, its options are set as soon as something imports it. (or now if it's already loaded)
 np.set_printoptions(precision=2, suppress=True)
+_torch_configured = False
+
+
+def _torch():
+    global _torch_configured
+    import torch
+    if not _torch_configured:
+        torch.set_printoptions(precision=2)
+        _torch_configured = True
+    return torch
+
+
+class _TorchImportHook:
+    """
+    Import hook which configures torch right after its first import, then removes itself.
+    """
+
+    def find_spec(self, name, path, target=None):
+        if name != 'torch':
+            return None
+
+        import importlib.util
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.loader is None or not hasattr(spec.loader, 'exec_module'):
+            return spec
+
+        exec_module = spec.loader.exec_module
+
+        def exec_and_configure(module):
+            global _torch_configured
+            exec_module(module)
+            module.set_printoptions(precision=2)
+            _torch_configured = True
+
+        spec.loader.exec_module = exec_and_configure
+        return spec
+
+
+if 'torch' in sys.modules:
+    _torch()
+else:
+    sys.meta_path.insert(0, _TorchImportHook())
 
 
 # stdout = sys.stdout
@@ -55,9 +100,9 @@ _print = print
 
 
 def print(*args, **kwargs):
-    from beeprint import pp
-    from munch import Munch
-    if isinstance(args[0], dict) or isinstance(args[0], Munch):
+    # Munch is a dict, no need to import it to check
+    if args and isinstance(args[0], dict):
+        from beeprint import pp
         pp(*args, **kwargs)
     else:
         _print(*args, **kwargs)
@@ -68,7 +113,6 @@ def print_bp(msg, *args, **kwargs):
 
 
 def printerr(msg, *args, **kwargs):
-    import sys
     print(msg, *args, **kwargs)
 
 
@@ -86,128 +130,481 @@ def pct(f: float):
     return f'{int(f * 100):02d}%'
 
 
+# Logging backend for the make_print loggers (logsession, logjob, ...)
+# msg can be a callable returning the message, so it is only formatted if the message is actually printed:
+#   logsession(lambda: f"session.save({path})")
+# Messages are always formatted on the calling thread, also in async mode, so they see the state at the time of the call.
+levels = dict(debug=10, info=20, warning=30, error=40, off=100)
+log_level = 'info'  # Default level of every module
+log_levels = {}  # Per-module levels, e.g. log_levels['session'] = 'warning'
+log_async = False  # Write from a background thread, the callers only enqueue (see enable_async_logging)
+log_repeat_interval = 0  # Seconds during which repeats of the same info/debug message are counted instead of printed, 0 to disable
+
+_log_queue = None
+_log_thread = None
+_log_repeats = {}  # (module, message key) -> [last print time, suppressed count, last printed line]
+_log_last_key = {}  # module -> key of its last message, a run of repeats ends when another message comes in
+_log_repeats_lock = threading.Lock()
+_log_atexit = False
+
+
+def set_log_level(module_name, level):
+    log_levels[module_name] = level
+
+
+def is_logged(module_name, level='info') -> bool:
+    return levels[level] >= levels[log_levels.get(module_name, log_level)]
+
+
+def enable_async_logging(enable=True):
+    """
+    Write the log messages from a background thread, so logging never blocks the render loop.
+    The queue is flushed at exit.
+    """
+    global log_async, _log_queue, _log_thread
+    log_async = enable
+    if enable and _log_thread is None:
+        import queue
+
+        _log_queue = queue.SimpleQueue()
+        _log_thread = threading.Thread(target=_log_worker, name='printlib-log', daemon=True)
+        _log_thread.start()
+        _log_register_atexit()
+    elif not enable:
+        flush_logs()
+
+
+def flush_logs():
+    """
+    Report the repeats still being counted, and wait until every queued message has been written.
+    """
+    with _log_repeats_lock:
+        ended = []
+        for entry in _log_repeats.values():
+            if entry[1]:
+                ended.append((entry[2], entry[1]))
+                entry[1] = 0
+    for line, n in ended:
+        _log_emit(f"{line} (repeated {n} times)", {})
+
+    if _log_thread is not None and _log_thread.is_alive():
+        done = threading.Event()
+        _log_queue.put(done)
+        done.wait(5)
+
+
+def _log_register_atexit():
+    global _log_atexit
+    if not _log_atexit:
+        import atexit
+        atexit.register(flush_logs)
+        _log_atexit = True
+
+
+def _log_worker():
+    while True:
+        item = _log_queue.get()
+        if isinstance(item, threading.Event):
+            item.set()
+            continue
+        try:
+            _log_write(*item)
+        except Exception:
+            traceback.print_exc()
+
+
+def _log_write(line, kwargs):
+    print(line, **kwargs)
+
+
+def _log_emit(line, kwargs):
+    if log_async and _log_thread is not None:
+        _log_queue.put((line, kwargs))
+    else:
+        _log_write(line, kwargs)
+
+
+def _log_repeat_check(module_name, msg):
+    """
+    Returns: A tuple (entry, ended)
+             entry: The repeat entry of this message to record the printed line into, or None to suppress this one.
+             ended: (line, count) of a run of repeats which just ended and must be reported, or None.
+    """
+    # Callables are keyed by their code, so a per-frame lambda counts as the same message
+    key = getattr(msg, '__code__', msg)
+    now = time.monotonic()
+    with _log_repeats_lock:
+        ended = None
+        last = _log_last_key.get(module_name)
+        _log_last_key[module_name] = key
+        if last is not None and last != key:
+            prev = _log_repeats.get((module_name, last))
+            if prev is not None and prev[1]:
+                ended = (prev[2], prev[1])
+                prev[1] = 0
+
+        entry = _log_repeats.get((module_name, key))
+        if entry is None:
+            if len(_log_repeats) > 10000:
+                _log_repeats.clear()
+            entry = [now, 0, None]
+            _log_repeats[(module_name, key)] = entry
+            return entry, ended
+        if now - entry[0] < log_repeat_interval:
+            entry[1] += 1
+            return None, ended
+
+        if entry[1]:
+            ended = (entry[2], entry[1])
+        entry[0] = now
+        entry[1] = 0
+        return entry, ended
+
+
+def _log(module_name, level, msg, args, kwargs):
+    if levels[level] < levels[log_levels.get(module_name, log_level)]:
+        return
+
+    # Warnings and errors are never suppressed
+    entry = None
+    if log_repeat_interval > 0 and levels[level] < levels['warning']:
+        _log_register_atexit()
+        entry, ended = _log_repeat_check(module_name, msg)
+        if ended is not None:
+            _log_emit(f"{ended[0]} (repeated {ended[1]} times)", {})
+        if entry is None:
+            return
+
+    if callable(msg):
+        msg = msg()
+
+    prefix = f"[{module_name}]"
+    if print_timing:
+        # The elapsed time since the last message
+        global last_time
+        now = time.time()
+        prefix = f"[{module_name}] ({now - last_time:.2f}s)"
+        last_time = now
+
+    kwargs = dict(kwargs)
+    sep = kwargs.pop('sep', ' ')
+    line = sep.join(str(v) for v in (f"{prefix} {msg}", *args))
+    if entry is not None:
+        entry[2] = line
+
+    _log_emit(line, kwargs)
+
+
 def make_print(module_name):
     def ret(msg, *args, **kwargs):
-        from yachalk import chalk
-        # Wrap all args[1:] in chalk.grey
-        # if len(args) > 1:
-        #     args = [args[0]] + [chalk.grey(str(a)) for a in args[1:]]
-        # if len(kwargs) > 1:
-        #     # key in red
-        #     kwargs = {chalk.white(k): chalk.dim(str(v)) for k, v in kwargs.items()}
-
-        if not print_timing:
-            print(f"[{module_name}] {msg}", *args, **kwargs)
-        else:
-            # Print the elapsed time since the last call to this function
-            import time
-            global last_time
-            if last_time and print_timing:
-                print(f"[{module_name}] ({time.time() - last_time:.2f}s) {msg}", *args, **kwargs)
-            else:
-                print(f"[{module_name}] {msg}", *args, **kwargs)
-            last_time = time.time()
+        _log(module_name, 'info', msg, args, kwargs)
 
     return ret
 
 
 def make_printerr(module_name):
     def ret(msg, *args, **kwargs):
-        printerr(f"[{module_name}] {msg}", *args, **kwargs)
+        _log(module_name, 'error', msg, args, kwargs)
 
     return ret
 
-indent = 0
+
+def make_printdebug(module_name):
+    def ret(msg, *args, **kwargs):
+        _log(module_name, 'debug', msg, args, kwargs)
+
+    return ret
+
+
+# Span recording, for a whole timeline of a render (see export_trace)
+# Each thread records into its own ring buffer, so threads never contend on a lock.
+record_trace = False
+trace_buffer_size = 100000  # Spans kept per thread
+
+_trace_local = threading.local()
+_trace_buffers = []  # (thread id, thread name, spans, thread) for every live thread which recorded spans
+_trace_retired = deque(maxlen=trace_buffer_size)  # (thread id, thread name, *span) of the threads which have exited
+_trace_buffers_lock = threading.Lock()
+
+
+def _get_trace_local():
+    tl = _trace_local
+    if not hasattr(tl, 'depth'):
+        tl.depth = 0
+        tl.spans = None
+    return tl
+
+
+def _retire_trace_buffers():
+    """
+    Move the spans of exited threads into the shared retired buffer, so worker churn
+    doesn't keep one buffer per thread forever. Must be called with the lock held.
+    """
+    alive = []
+    for tid, tname, spans, thread in _trace_buffers:
+        if thread.is_alive():
+            alive.append((tid, tname, spans, thread))
+        else:
+            _trace_retired.extend((tid, tname, *span) for span in spans)
+    _trace_buffers[:] = alive
+
+
+def _record_span(tl, name, start, end, args=None):
+    if tl.spans is None:
+        tl.spans = deque(maxlen=trace_buffer_size)
+        with _trace_buffers_lock:
+            _retire_trace_buffers()
+            _trace_buffers.append((threading.get_ident(), threading.current_thread().name, tl.spans, threading.current_thread()))
+
+    if not isinstance(name, str):
+        name = str(name)  # Don't keep the arguments of a _TraceCall alive in the buffer
+    tl.spans.append((name, start, end, tl.depth, args))
+
 
 @contextmanager
 def trace(name) -> float:
-    global indent
+    tl = _get_trace_local()
 
     start = perf_counter()
-    indent += 1
-    yield lambda: perf_counter() - start
-    indent -= 1
+    tl.depth += 1
+    try:
+        yield lambda: perf_counter() - start
+    finally:
+        tl.depth -= 1
 
-    seconds = perf_counter() - start
-    if (seconds * 1000) < 2:
+    end = perf_counter()
+    if record_trace:
+        _record_span(tl, name, start, end)
+
+    seconds = end - start
+    if not print_trace or (seconds * 1000) < 2:
         return
     if seconds >= 1:
         s = f'({seconds:.3f}s) {name}'
     else:
         s = f'({int(seconds * 1000)}ms) {name}'
     from yachalk import chalk
-    if print_trace:
-        s = '..' * indent + s
-        print(chalk.grey(s))
+    s = '..' * tl.depth + s
+    print(chalk.grey(s))
 
 
 
 @contextmanager
 def gputrace(name, vram_dt=False) -> float:
+    tl = _get_trace_local()
     vram = 0
     if vram_dt:
+        torch = _torch()
         vram = torch.cuda.memory_allocated()
     start = perf_counter()
-    yield lambda: perf_counter() - start
-    s = f'{name}: {perf_counter() - start:.3f}s'
+    tl.depth += 1
+    try:
+        yield lambda: perf_counter() - start
+    finally:
+        tl.depth -= 1
+    end = perf_counter()
+    s = f'{name}: {end - start:.3f}s'
+    args = None
     if vram_dt:
         vram = (torch.cuda.memory_allocated() - vram) / 1024 / 1024 / 1024
         s += f' {vram:.3f}GB / {torch.cuda.memory_allocated() / 1024 / 1024 / 1024:.3f}GB'
+        args = dict(vram_dt_gb=round(vram, 3))
+    if record_trace:
+        _record_span(tl, name, start, end, args)
     from yachalk import chalk
     if print_gputrace:
         print(chalk.grey(s))
 
 
+def get_trace_spans():
+    """
+    Returns: A list of (thread id, thread name, name, start, end, depth, args) for every recorded span, times in seconds.
+    """
+    with _trace_buffers_lock:
+        _retire_trace_buffers()
+        buffers = list(_trace_buffers)
+        ret = list(_trace_retired)
+
+    for tid, tname, spans, thread in buffers:
+        for name, start, end, depth, args in spans.copy():
+            ret.append((tid, tname, name, start, end, depth, args))
+    return ret
+
+
+def clear_trace():
+    with _trace_buffers_lock:
+        _retire_trace_buffers()
+        _trace_retired.clear()
+        for tid, tname, spans, thread in _trace_buffers:
+            spans.clear()
+
+
+def export_trace(path):
+    """
+    Write the recorded spans as a Chrome trace (chrome://tracing, ui.perfetto.dev)
+    """
+    import json
+    import os
+    from pathlib import Path
+
+    pid = os.getpid()
+    events = []
+    threads = {}
+    for tid, tname, name, start, end, depth, args in get_trace_spans():
+        threads[tid] = tname
+        ev = dict(name=str(name), ph='X', ts=start * 1e6, dur=(end - start) * 1e6, pid=pid, tid=tid)
+        if args:
+            ev['args'] = args
+        events.append(ev)
+
+    for tid, tname in threads.items():
+        events.append(dict(name='thread_name', ph='M', pid=pid, tid=tid, args=dict(name=tname)))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f)
+
+    return path
+
+
+# cputrace settings
+cputrace_dir = None  # Where the profiles are written, defaults to paths.tmp/profiles
+cputrace_clock = 'cpu'  # 'cpu' or 'wall'
+cputrace_own_modules = True  # Only keep the functions of our own code (core, plugins, scripts)
+cputrace_aggregate = False  # Accumulate across calls and write once with cputrace_dump()
+cputrace_print = False  # Also print the stats to stdout
+
+_cputrace_counts = {}
+logcputrace = make_print('cputrace')
+_cputrace_started = False
+
+
 @contextmanager
-def cputrace(name, enable=True, enable_trace=False) -> float:
+def cputrace(name, enable=True, enable_trace=False, session=None) -> float:
+    """
+    Profile a block with yappi and write the profile to disk, in pstats (.prof) and callgrind formats.
+    Files are named after the session and span: <cputrace_dir>/<session>_<name>_<n>.prof
+    In aggregate mode the stats keep accumulating across calls until cputrace_dump().
+    """
+    global _cputrace_started
     if not enable:
         if enable_trace:
-            trace(name)
-        yield None
+            with trace(name):
+                yield None
+        else:
+            yield None
         return
 
     import yappi
-    yappi.clear_stats()
-    yappi.set_clock_type('cpu')
+    if not cputrace_aggregate or not _cputrace_started:
+        yappi.clear_stats()
+        yappi.set_clock_type(cputrace_clock)
+        _cputrace_started = True
+
     yappi.start()
+    try:
+        yield None
+    finally:
+        yappi.stop()
 
-    yield None
+    if not cputrace_aggregate:
+        n = _cputrace_counts.get((session, name), 0) + 1
+        _cputrace_counts[(session, name)] = n
+        _cputrace_write(f'{session or "nosession"}_{name}_{n:04d}')
 
-    columns = {
-        0: ("name", 80),
-        1: ("ncall", 5),
-        2: ("tsub", 8),
-        3: ("ttot", 8),
-        4: ("tavg", 8)
-    }
-    # Print and limit the number of functions to 100
-    yappi.get_func_stats().print_all(columns=columns)
-    yappi.stop()
-    input("Press Enter to continue...")
 
+def cputrace_dump(name='aggregate', session=None):
+    """
+    Write the stats accumulated by cputrace in aggregate mode, then reset them.
+    """
+    global _cputrace_started
+    if not _cputrace_started:
+        return None
 
-def trace_decorator(func):
-    def _trace_wrapper(*args, **kwargs):
+    ret = _cputrace_write(f'{session or "nosession"}_{name}')
+    import yappi
+    yappi.clear_stats()
+    _cputrace_started = False
+    return ret
+
+
+def _cputrace_write(filename):
+    import yappi
+    from pathlib import Path
+    from . import paths
+
+    filter_callback = None
+    if cputrace_own_modules:
+        own = (paths.code_core.as_posix(), paths.code_plugins.as_posix(), paths.scripts.as_posix())
+        filter_callback = lambda stat: Path(stat.module).as_posix().startswith(own)
+
+    stats = yappi.get_func_stats(filter_callback=filter_callback)
+
+    dirpath = Path(cputrace_dir or paths.tmp / 'profiles')
+    dirpath.mkdir(parents=True, exist_ok=True)
+    path = dirpath / f'{filename}.prof'
+    stats.save(path.as_posix(), type='pstat')
+    stats.save(path.with_suffix('.callgrind').as_posix(), type='callgrind')
+
+    if cputrace_print:
+        columns = {
+            0: ("name", 80),
+            1: ("ncall", 5),
+            2: ("tsub", 8),
+            3: ("ttot", 8),
+            4: ("tavg", 8)
+        }
+        stats.print_all(columns=columns)
+
+    logcputrace(f'{path} ({cputrace_clock} clock)')
+    return path
+
+
+class _TraceCall:
+    """
+    The name of a traced call, the arguments are only formatted if the span is emitted.
+    """
+    __slots__ = ('name', 'args', 'kwargs')
+
+    def __init__(self, name, args, kwargs):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
         s_kargs = []
-        for a in args:
+        for a in self.args:
             s_kargs.append(value_to_print_str(a))
 
         s_kwargs = []
-        for k, v in kwargs.items():
+        for k, v in self.kwargs.items():
             s_k = value_to_print_str(k)
             s_v = value_to_print_str(v)
             s_kwargs.append(f'{s_k}={s_v}')
 
         s = ', '.join(s_kargs + s_kwargs)
+        return f'{self.name}({s})'
+
+
+def trace_decorator(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    def _trace_wrapper(*args, **kwargs):
+        # Fast path, nothing would be emitted
+        if not print_trace and not record_trace:
+            return func(*args, **kwargs)
 
-        with trace(f'{func.__name__}({s})'):
+        with trace(_TraceCall(name, args, kwargs)):
             return func(*args, **kwargs)
 
     return _trace_wrapper
 
 
 def value_to_print_str(v):
-    from PIL import Image
+    # Only check for PIL images if PIL is loaded, no need to import it for that
+    Image = sys.modules.get('PIL.Image')
 
     s_v = ""
     # idk why we have to check for bools or if its even required, not gonna question it I have better things to do like actually getting stuff done
@@ -216,14 +613,14 @@ def value_to_print_str(v):
     elif isinstance(v, int) and not isinstance(v, bool):
         s_v = f"{v}"
     # tuple of floats
-    elif isinstance(v, tuple) and isinstance(v[0], float):
+    elif isinstance(v, tuple) and v and isinstance(v[0], float):
         # convert each float to a string with 2 decimal places
         v = tuple(f"{x:.2f}" for x in v)
         s_v = f"{v}"
     elif isinstance(v, np.ndarray):
         s_v = f"ndarray{v.shape}"
     # Simplified PIL image
-    elif isinstance(v, Image.Image):
+    elif Image is not None and isinstance(v, Image.Image):
         s_v = f"PIL({v.width}x{v.height}, {v.mode})"
     # Limit floats to 2 decimals
     elif isinstance(v, float):